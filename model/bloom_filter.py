@@ -2,9 +2,31 @@ from copy import copy
 from typing import *
 from bitarray import bitarray
 from dataclasses import dataclass
+import numpy as np
 import random
 import abc
 
+from hashes import *
+
+@dataclass(frozen=True)
+class FalsePosEstimate:
+  """
+  Empirical false positive rate with a Wilson score confidence interval
+  """
+  rate: float
+  lower: float
+  upper: float
+  num_samples: int
+
+def wilson_interval(num_hits: int, num_samples: int, z: float = 1.96) -> FalsePosEstimate:
+  if num_samples == 0:
+    return FalsePosEstimate(rate=0.0, lower=0.0, upper=1.0, num_samples=0)
+  p = num_hits / num_samples
+  denom = 1 + z**2 / num_samples
+  center = (p + z**2 / (2 * num_samples)) / denom
+  half = z * np.sqrt(p * (1 - p) / num_samples + z**2 / (4 * num_samples**2)) / denom
+  return FalsePosEstimate(rate=p, lower=max(0.0, center - half), upper=min(1.0, center + half), num_samples=num_samples)
+
 class Set(abc.ABC):
   def add(self, elem: int):
     raise NotImplementedError
@@ -33,10 +55,41 @@ class Set(abc.ABC):
   def estimate_contents(self, addr_space: list[int]) -> list[int]:
     raise NotImplementedError
 
+  def add_many(self, elems: np.ndarray):
+    raise NotImplementedError
+
+  def contains_many(self, elems: np.ndarray) -> np.ndarray:
+    raise NotImplementedError
+
+  def fill_ratio(self) -> np.ndarray:
+    """
+    Fraction of bits set, per partition
+    """
+    raise NotImplementedError
+
+  def estimate_false_pos_rate(self) -> float:
+    """
+    False positive rate implied by the current fill ratio, assuming uniform hashing
+    """
+    raise NotImplementedError
+
+  def sample_false_pos_rate(self, non_members: np.ndarray, num_samples: int | None = None,
+                            rng: np.random.Generator | None = None, z: float = 1.96) -> FalsePosEstimate:
+    """
+    Probe elements known not to be in the set. Probes all of them if num_samples is None,
+    otherwise num_samples drawn uniformly with replacement.
+    """
+    non_members = np.asarray(non_members)
+    if num_samples is not None and num_samples < len(non_members):
+      rng = rng if rng is not None else np.random.default_rng()
+      non_members = non_members[rng.integers(0, len(non_members), size=num_samples)]
+    num_hits = int(np.count_nonzero(self.contains_many(non_members)))
+    return wilson_interval(num_hits, len(non_members), z)
+
 @dataclass
 class BloomFilter(Set):
   bits: bitarray
-  hash_fns: list[Callable[[int], int]]
+  hash_fns: Sequence[Callable[[int], int]]
 
   def add(self, elem: int):
     for fn in self.hash_fns:
@@ -47,16 +100,23 @@ class BloomFilter(Set):
 
   def __and__(self, other: Self) -> Self:
     assert isinstance(other, BloomFilter)
-    assert all((f1 == f2 for f1, f2 in zip(self.hash_fns, other.hash_fns)))
+    assert self.hash_fns == other.hash_fns
     assert len(self.bits) == len(other.bits)
     return BloomFilter(bits=self.bits & other.bits, hash_fns=self.hash_fns)
 
   def __or__(self, other: Self) -> Self:
     assert isinstance(other, BloomFilter)
-    assert all((f1 == f2 for f1, f2 in zip(self.hash_fns, other.hash_fns)))
+    assert self.hash_fns == other.hash_fns
     assert len(self.bits) == len(other.bits)
     return BloomFilter(bits=self.bits | other.bits, hash_fns=self.hash_fns)
 
+  def __ior__(self, other: Self) -> Self:
+    assert isinstance(other, BloomFilter)
+    assert self.hash_fns == other.hash_fns
+    assert len(self.bits) == len(other.bits)
+    self.bits |= other.bits
+    return self
+
   def remove(self, elem: int):
     raise Exception("Bloom filter does not support removal")
 
@@ -67,31 +127,88 @@ class BloomFilter(Set):
     return BloomFilter(bits=copy(self.bits), hash_fns=self.hash_fns)
 
   def __bool__(self) -> bool:
-    return any(bit for bit in self.bits)
+    return self.bits.any()
 
   def estimate_contents(self, addr_space: list[int]) -> list[int]:
-    return [elem for elem in addr_space if elem in self]
+    addr_space = np.asarray(addr_space)
+    return addr_space[self.contains_many(addr_space)].tolist()
+
+  def fill_ratio(self) -> np.ndarray:
+    return np.array([self.bits.count() / len(self.bits)])
+
+  def estimate_false_pos_rate(self) -> float:
+    # All hash functions index the same bit array
+    return float(self.fill_ratio()[0] ** len(self.hash_fns))
+
+  def add_many(self, elems: np.ndarray):
+    positions = np.unique(hash_family_many(self.hash_fns, elems))
+    if len(positions) > 0:
+      self.bits[positions.tolist()] = 1
+
+  def contains_many(self, elems: np.ndarray) -> np.ndarray:
+    dense = np.frombuffer(self.bits.unpack(), dtype=np.uint8).view(np.bool_)
+    return dense[hash_family_many(self.hash_fns, elems)].all(axis=0)
 
 @dataclass
 class ParallelBloomFilter(Set):
-  parts: list[BloomFilter]
+  """
+  Bloom filter with one hash function per partition. All partitions live in one packed uint64 word
+  array, partition i starting at word i * words_per_part, like bloom_t.bits[] in wrapper/include/bloom.h.
+  """
+  words: np.ndarray
+  hash_fns: Sequence[Callable[[int], int]]
+  len_per_part: int
+
+  @property
+  def num_parts(self) -> int:
+    return len(self.hash_fns)
+
+  @property
+  def words_per_part(self) -> int:
+    return len(self.words) // self.num_parts
+
+  @property
+  def offsets(self) -> np.ndarray:
+    return np.arange(self.num_parts) * self.words_per_part
+
+  def _locate(self, elems: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Word indices and bit masks of elems, one row per partition
+    """
+    positions = hash_family_many(self.hash_fns, elems).astype(np.uint64)
+    word_idx = (positions >> np.uint64(6)).astype(np.intp) + self.offsets[:, None]
+    masks = np.uint64(1) << (positions & np.uint64(63))
+    return word_idx, masks
 
   def add(self, elem: int):
-    for part in self.parts:
-      part.add(elem)
+    for offset, fn in zip(self.offsets, self.hash_fns):
+      pos = fn(elem)
+      self.words[offset + pos // 64] |= np.uint64(1 << (pos % 64))
 
   def __contains__(self, elem: int) -> bool:
-    return all(elem in part for part in self.parts)
+    return all(
+      (int(self.words[offset + pos // 64]) >> (pos % 64)) & 1
+      for offset, pos in zip(self.offsets, (fn(elem) for fn in self.hash_fns))
+    )
 
-  def __and__(self, other: Self) -> Self:
+  def _check_compatible(self, other: Self):
     assert isinstance(other, ParallelBloomFilter)
-    assert len(self.parts) == len(other.parts)
-    return ParallelBloomFilter(parts=[p1&p2 for p1, p2 in zip(self.parts, other.parts)])
+    assert self.hash_fns == other.hash_fns
+    assert self.len_per_part == other.len_per_part
+    assert len(self.words) == len(other.words)
+
+  def __and__(self, other: Self) -> Self:
+    self._check_compatible(other)
+    return ParallelBloomFilter(words=self.words & other.words, hash_fns=self.hash_fns, len_per_part=self.len_per_part)
 
   def __or__(self, other: Self) -> Self:
-    assert isinstance(other, ParallelBloomFilter)
-    assert len(self.parts) == len(other.parts)
-    return ParallelBloomFilter(parts=[p1|p2 for p1, p2 in zip(self.parts, other.parts)])
+    self._check_compatible(other)
+    return ParallelBloomFilter(words=self.words | other.words, hash_fns=self.hash_fns, len_per_part=self.len_per_part)
+
+  def __ior__(self, other: Self) -> Self:
+    self._check_compatible(other)
+    np.bitwise_or(self.words, other.words, out=self.words)
+    return self
 
   def remove(self, elem: int):
     raise Exception("Parallel bloom filter does not support removal")
@@ -100,55 +217,545 @@ class ParallelBloomFilter(Set):
     raise Exception("Parallel bloom filter does not support length operation")
 
   def __copy__(self) -> Self:
-    return ParallelBloomFilter(parts=[part.copy() for part in self.parts])
+    return ParallelBloomFilter(words=self.words.copy(), hash_fns=self.hash_fns, len_per_part=self.len_per_part)
+
+  def __bool__(self) -> bool:
+    # Empty as soon as any single partition is empty
+    return bool(self.words.reshape(self.num_parts, -1).any(axis=1).all())
+
+  def popcount(self) -> np.ndarray:
+    """
+    Number of set bits in each partition
+    """
+    return popcount_words(self.words.reshape(self.num_parts, -1)).sum(axis=1)
+
+  def estimate_contents(self, addr_space: list[int]) -> list[int]:
+    addr_space = np.asarray(addr_space)
+    return addr_space[self.contains_many(addr_space)].tolist()
+
+  def fill_ratio(self) -> np.ndarray:
+    return self.popcount() / self.len_per_part
+
+  def estimate_false_pos_rate(self) -> float:
+    # A non-member is reported present only if its bit is set in every partition
+    return float(np.prod(self.fill_ratio()))
+
+  def add_many(self, elems: np.ndarray):
+    word_idx, masks = self._locate(elems)
+    np.bitwise_or.at(self.words, word_idx.ravel(), masks.ravel())
+
+  def contains_many(self, elems: np.ndarray) -> np.ndarray:
+    word_idx, masks = self._locate(elems)
+    return ((self.words[word_idx] & masks) != 0).all(axis=0)
+
+# Supported counter widths; 4-bit counters are packed two per byte
+COUNTER_BITS = (4, 8, 16, 32)
+_COUNTER_DTYPES = {4: np.uint8, 8: np.uint8, 16: np.uint16, 32: np.uint32}
+
+def counter_bits_for(max_count: int) -> int:
+  """
+  Narrowest supported counter width that counts to max_count without saturating
+  """
+  return next(bits for bits in COUNTER_BITS if 2**bits - 1 >= max_count)
+
+def _pack_counters(counts: np.ndarray, counter_bits: int) -> np.ndarray:
+  if counter_bits != 4:
+    return counts.astype(_COUNTER_DTYPES[counter_bits])
+  counts = np.append(counts, np.zeros(len(counts) % 2, dtype=counts.dtype)).astype(np.uint8)
+  return counts[0::2] | (counts[1::2] << np.uint8(4))
+
+@dataclass
+class CountingBloomFilter(Set):
+  """
+  Parallel Bloom filter with a small saturating counter in place of each bit, so elements can be removed.
+  Same hashing and partition layout as ParallelBloomFilter, so it can be tested against signatures directly.
+  A counter that reaches max_count has lost track of how many elements hit it and is never decremented, so size
+  counter_bits for the most live elements that can share a counter, or clear() the filter once it is known to be empty.
+  """
+  counters: np.ndarray  # num_parts * len_per_part counters, packed two per byte when counter_bits == 4
+  hash_fns: HashFamily
+  len_per_part: int
+  counter_bits: int = 4
+
+  @property
+  def num_parts(self) -> int:
+    return len(self.hash_fns)
+
+  @property
+  def max_count(self) -> int:
+    return 2**self.counter_bits - 1
+
+  def _get(self, idx: np.ndarray) -> np.ndarray:
+    if self.counter_bits != 4:
+      return self.counters[idx]
+    return (self.counters[idx >> 1] >> ((idx & 1) << 2).astype(np.uint8)) & np.uint8(0xF)
+
+  def _set(self, idx: np.ndarray, values: np.ndarray):
+    """
+    Store values at distinct counter indices idx
+    """
+    if self.counter_bits != 4:
+      self.counters[idx] = values
+      return
+    # Two indices can share a byte, so write the low and the high nibbles in separate passes
+    for half, keep in [(0, np.uint8(0xF0)), (1, np.uint8(0x0F))]:
+      sel = (idx & 1) == half
+      byte = idx[sel] >> 1
+      self.counters[byte] = (self.counters[byte] & keep) | (values[sel].astype(np.uint8) << np.uint8(4 * half))
+
+  def counts(self) -> np.ndarray:
+    """
+    Every counter, unpacked
+    """
+    if self.counter_bits != 4:
+      return self.counters
+    return np.stack([self.counters & np.uint8(0xF), self.counters >> np.uint8(4)], axis=1).ravel()[:self.num_parts * self.len_per_part]
+
+  def _locate(self, elems: np.ndarray) -> np.ndarray:
+    positions = hash_family_many(self.hash_fns, elems).astype(np.intp)
+    return (positions + (np.arange(self.num_parts) * self.len_per_part)[:, None]).ravel()
+
+  def _adjust(self, idx: np.ndarray, deltas: np.ndarray):
+    """
+    Add deltas to the counters at (distinct) indices idx, saturating at max_count and leaving saturated counters alone.
+    Only the touched counters are read, so retiring an element costs O(num_parts).
+    """
+    counters = self._get(idx).astype(np.int64)
+    saturated = counters == self.max_count
+    counters += deltas
+    if (counters < 0).any():
+      raise Exception("Counting bloom filter cannot remove elements that were never added")
+    self._set(idx, np.where(saturated, self.max_count, np.minimum(counters, self.max_count)))
+
+  def clear(self):
+    self.counters[:] = 0
+
+  def add(self, elem: int):
+    self.add_many(np.array([elem]))
+
+  def __contains__(self, elem: int) -> bool:
+    return bool(self.contains_many(np.array([elem]))[0])
+
+  def remove(self, elem: int):
+    self.remove_many(np.array([elem]))
+
+  def add_many(self, elems: np.ndarray):
+    idx, counts = np.unique(self._locate(elems), return_counts=True)
+    self._adjust(idx, counts)
+
+  def remove_many(self, elems: np.ndarray):
+    idx, counts = np.unique(self._locate(elems), return_counts=True)
+    self._adjust(idx, -counts)
+
+  def contains_many(self, elems: np.ndarray) -> np.ndarray:
+    return (self._get(self._locate(elems)) > 0).reshape(self.num_parts, -1).all(axis=0)
+
+  def _signature_bits(self, sig: ParallelBloomFilter) -> np.ndarray:
+    """
+    Counter indices of the bits set in a signature, found from its non-zero words only
+    """
+    assert sig.hash_fns == self.hash_fns and sig.len_per_part == self.len_per_part
+    words = sig.words.astype(np.uint64)
+    nonzero = np.flatnonzero(words)
+    bits = np.unpackbits(words[nonzero].astype('<u8').view(np.uint8).reshape(len(nonzero), 8), axis=1, bitorder='little')
+    word_idx, bit_idx = np.nonzero(bits)
+    words_per_part = len(words) // self.num_parts
+    part, word_in_part = np.divmod(nonzero[word_idx], words_per_part)
+    return part * self.len_per_part + word_in_part * 64 + bit_idx
+
+  def add_signature(self, sig: ParallelBloomFilter):
+    """
+    Count every bit set in a signature built with the same hash functions
+    """
+    self._adjust(self._signature_bits(sig), 1)
+
+  def remove_signature(self, sig: ParallelBloomFilter):
+    self._adjust(self._signature_bits(sig), -1)
+
+  def to_bloom_filter(self) -> ParallelBloomFilter:
+    """
+    The plain signature of the current contents (bits whose counter is non-zero)
+    """
+    words_per_part = -(-self.len_per_part // 64)
+    bits = np.zeros((self.num_parts, words_per_part * 64), dtype=np.bool_)
+    bits[:, :self.len_per_part] = self.counts().reshape(self.num_parts, -1) > 0
+    words = np.packbits(bits, axis=1, bitorder='little').view('<u8').astype(np.uint64).ravel()
+    return ParallelBloomFilter(words=words, hash_fns=self.hash_fns, len_per_part=self.len_per_part)
+
+  def overlap(self, sig: ParallelBloomFilter) -> np.ndarray:
+    """
+    Counter indices where the signature has a bit set and the contents are non-zero; reads only those counters
+    """
+    idx = self._signature_bits(sig)
+    return idx[self._get(idx) > 0]
+
+  def covers_all_parts(self, idx: np.ndarray) -> bool:
+    """
+    Whether counter indices idx hit every partition, i.e. whether the bits they mark form a non-empty intersection
+    """
+    hit = np.zeros(self.num_parts, dtype=np.bool_)
+    hit[idx // self.len_per_part] = True
+    return bool(hit.all())
+
+  def intersects(self, sig: ParallelBloomFilter) -> bool:
+    """
+    Whether a signature may share an element with the contents, i.e. bool(self.to_bloom_filter() & sig)
+    """
+    return self.covers_all_parts(self.overlap(sig))
+
+  def _check_compatible(self, other: Self):
+    assert isinstance(other, CountingBloomFilter)
+    assert self.hash_fns == other.hash_fns
+    assert self.len_per_part == other.len_per_part and self.counter_bits == other.counter_bits
+
+  def __and__(self, other: Self) -> Self:
+    self._check_compatible(other)
+    return CountingBloomFilter(counters=_pack_counters(np.minimum(self.counts(), other.counts()), self.counter_bits),
+                               hash_fns=self.hash_fns, len_per_part=self.len_per_part, counter_bits=self.counter_bits)
+
+  def __or__(self, other: Self) -> Self:
+    self._check_compatible(other)
+    res = copy(self)
+    res |= other
+    return res
+
+  def __ior__(self, other: Self) -> Self:
+    self._check_compatible(other)
+    other_counts = other.counts()
+    idx = np.flatnonzero(other_counts)
+    self._adjust(idx, other_counts[idx].astype(np.int64))
+    return self
+
+  def __len__(self) -> int:
+    raise Exception("Counting bloom filter does not support length operation")
+
+  def __copy__(self) -> Self:
+    return CountingBloomFilter(counters=self.counters.copy(), hash_fns=self.hash_fns,
+                               len_per_part=self.len_per_part, counter_bits=self.counter_bits)
 
   def __bool__(self) -> bool:
-    return all(bool(part) for part in self.parts)
+    return bool((self.counts().reshape(self.num_parts, -1) > 0).any(axis=1).all())
 
   def estimate_contents(self, addr_space: list[int]) -> list[int]:
-    return [elem for elem in addr_space if elem in self]
+    addr_space = np.asarray(addr_space)
+    return addr_space[self.contains_many(addr_space)].tolist()
 
-def make_hash_function(buckets):
-  mult = random.randint(2**40, 2**50)*2 + 1
-  def f(x):
-    return (x * mult) // 2**35 % buckets
-  return f
+  def fill_ratio(self) -> np.ndarray:
+    return (self.counts().reshape(self.num_parts, -1) > 0).mean(axis=1)
 
-def make_bloom_filter_family(len_signature: int, num_hashes: int) -> Callable[[], BloomFilter]:
-  hash_fns = [make_hash_function(len_signature) for _ in range(num_hashes)]
-  return lambda: BloomFilter(bits=bitarray(len_signature), hash_fns=hash_fns)
+  def estimate_false_pos_rate(self) -> float:
+    return float(np.prod(self.fill_ratio()))
 
+# Summary layout in new-pmhw/src/MainTypes.bsv
+NUM_BLOOM_PARTS = 4
+NUM_BLOOM_CHUNKS = 4
+BLOOM_CHUNK_SIZE = 256
 
-def make_bloom_filter(len_signature: int, num_hashes: int) -> BloomFilter:
-  return make_bloom_filter_family(len_signature, num_hashes)()
+@dataclass(frozen=True)
+class ChunkStats:
+  fill_ratio: np.ndarray  # (num_parts, num_chunks) fraction of bits set
+  obj_counts: np.ndarray  # (num_parts, num_chunks) objects inserted that addressed the chunk
+  accesses: np.ndarray    # (num_chunks,) reads of each BRAM row (chunk index, all parts)
+
+@dataclass
+class ChunkedBloomFilter(Set):
+  """
+  Parallel Bloom filter laid out like the hardware Summary: each of the num_parts partitions is split into
+  num_chunks chunks of chunk_size bits, and chunk c of every part forms one BRAM row (BloomChunkParts).
+  Each hash gives a (chunk, bit) location, so operations touch only the rows their objects address;
+  every row touched is counted once per operation.
+  """
+  words: np.ndarray  # (num_chunks, num_parts, chunk_size // 64) uint64
+  hash_fns: HashFamily
+  obj_counts: np.ndarray
+  accesses: np.ndarray
+
+  @property
+  def num_chunks(self) -> int:
+    return self.words.shape[0]
+
+  @property
+  def num_parts(self) -> int:
+    return self.words.shape[1]
+
+  @property
+  def chunk_size(self) -> int:
+    return self.words.shape[2] * 64
+
+  @property
+  def num_objs(self) -> int:
+    """
+    Objects inserted so far (BloomObjCount)
+    """
+    return int(self.obj_counts[0].sum())
+
+  def _locate(self, elems: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Chunk indices, word indices within the chunk and bit masks of elems, one row per partition
+    """
+    positions = hash_family_many(self.hash_fns, elems).astype(np.uint64)
+    chunk_size = np.uint64(self.chunk_size)
+    chunks = (positions // chunk_size).astype(np.intp)
+    bits = positions % chunk_size
+    return chunks, (bits >> np.uint64(6)).astype(np.intp), np.uint64(1) << (bits & np.uint64(63))
+
+  def _touch(self, chunks: np.ndarray):
+    touched = np.unique(chunks)
+    self.accesses[touched] += 1
+
+  def _touch_each(self, chunks: np.ndarray):
+    # Count each distinct row once per element (column)
+    rows = np.sort(chunks, axis=0)
+    first = np.ones(rows.shape, dtype=np.bool_)
+    first[1:] = rows[1:] != rows[:-1]
+    np.add.at(self.accesses, rows[first], 1)
 
+  def add(self, elem: int):
+    self.add_many(np.array([elem]))
+
+  def __contains__(self, elem: int) -> bool:
+    return bool(self.contains_many(np.array([elem]))[0])
+
+  def conflicts(self, elems: np.ndarray) -> bool:
+    """
+    Whether any of a transaction's objects may be present, reading each addressed row once
+    """
+    chunks, word_idx, masks = self._locate(elems)
+    self._touch(chunks)
+    parts = np.arange(self.num_parts)[:, None]
+    return bool(((self.words[chunks, parts, word_idx] & masks) != 0).all(axis=0).any())
+
+  def add_txn(self, elems: np.ndarray):
+    """
+    Insert all of a transaction's objects, reading and writing each addressed row once
+    """
+    chunks, word_idx, masks = self._locate(elems)
+    self._touch(chunks)
+    self._set(chunks, word_idx, masks)
+
+  def _set(self, chunks: np.ndarray, word_idx: np.ndarray, masks: np.ndarray):
+    parts = np.broadcast_to(np.arange(self.num_parts)[:, None], chunks.shape)
+    np.bitwise_or.at(self.words, (chunks.ravel(), parts.ravel(), word_idx.ravel()), masks.ravel())
+    np.add.at(self.obj_counts, (parts.ravel(), chunks.ravel()), 1)
+
+  def _check_compatible(self, other: Self):
+    assert isinstance(other, ChunkedBloomFilter)
+    assert self.hash_fns == other.hash_fns
+    assert self.words.shape == other.words.shape
+
+  def __and__(self, other: Self) -> Self:
+    self._check_compatible(other)
+    return ChunkedBloomFilter(words=self.words & other.words, hash_fns=self.hash_fns,
+                              obj_counts=np.minimum(self.obj_counts, other.obj_counts),
+                              accesses=np.zeros_like(self.accesses))
+
+  def __or__(self, other: Self) -> Self:
+    self._check_compatible(other)
+    return ChunkedBloomFilter(words=self.words | other.words, hash_fns=self.hash_fns,
+                              obj_counts=self.obj_counts + other.obj_counts,
+                              accesses=np.zeros_like(self.accesses))
+
+  def __ior__(self, other: Self) -> Self:
+    self._check_compatible(other)
+    np.bitwise_or(self.words, other.words, out=self.words)
+    self.obj_counts += other.obj_counts
+    return self
+
+  def remove(self, elem: int):
+    raise Exception("Chunked bloom filter does not support removal")
 
-def make_parallel_bloom_filter_family(len_signature: int, num_partitions: int) -> Callable[[], ParallelBloomFilter]:
+  def __len__(self) -> int:
+    raise Exception("Chunked bloom filter does not support length operation")
+
+  def __copy__(self) -> Self:
+    return ChunkedBloomFilter(words=self.words.copy(), hash_fns=self.hash_fns,
+                              obj_counts=self.obj_counts.copy(), accesses=self.accesses.copy())
+
+  def __bool__(self) -> bool:
+    return bool(self.words.any(axis=(0, 2)).all())
+
+  def chunk_popcount(self) -> np.ndarray:
+    """
+    Number of set bits in each chunk, shape (num_parts, num_chunks)
+    """
+    return popcount_words(self.words).sum(axis=2).T
+
+  def chunk_stats(self) -> ChunkStats:
+    return ChunkStats(fill_ratio=self.chunk_popcount() / self.chunk_size,
+                      obj_counts=self.obj_counts.copy(), accesses=self.accesses.copy())
+
+  def estimate_contents(self, addr_space: list[int]) -> list[int]:
+    addr_space = np.asarray(addr_space)
+    return addr_space[self.contains_many(addr_space)].tolist()
+
+  def fill_ratio(self) -> np.ndarray:
+    return self.chunk_popcount().sum(axis=1) / (self.num_chunks * self.chunk_size)
+
+  def estimate_false_pos_rate(self) -> float:
+    return float(np.prod(self.fill_ratio()))
+
+  def add_many(self, elems: np.ndarray):
+    chunks, word_idx, masks = self._locate(elems)
+    self._touch_each(chunks)
+    self._set(chunks, word_idx, masks)
+
+  def contains_many(self, elems: np.ndarray) -> np.ndarray:
+    chunks, word_idx, masks = self._locate(elems)
+    self._touch_each(chunks)
+    parts = np.arange(self.num_parts)[:, None]
+    return ((self.words[chunks, parts, word_idx] & masks) != 0).all(axis=0)
+
+def popcount_words(words: np.ndarray) -> np.ndarray:
+  """
+  Number of set bits in each uint64 word
+  """
+  if hasattr(np, "bitwise_count"):
+    return np.bitwise_count(words).astype(np.int64)
+  bits = np.unpackbits(np.ascontiguousarray(words).view(np.uint8).reshape(*words.shape, 8), axis=-1)
+  return bits.sum(axis=-1, dtype=np.int64)
+
+@dataclass(frozen=True)
+class BloomFilterFamily:
+  """
+  Factory for empty BloomFilters sharing the same hash functions
+  """
+  len_signature: int
+  hash_fns: HashFamily
+
+  def __call__(self) -> BloomFilter:
+    return BloomFilter(bits=bitarray(self.len_signature), hash_fns=self.hash_fns)
+
+@dataclass(frozen=True)
+class ParallelBloomFilterFamily:
+  """
+  Factory for empty ParallelBloomFilters sharing the same hash functions (one per partition)
+  """
+  len_per_part: int
+  hash_fns: HashFamily
+
+  @property
+  def num_parts(self) -> int:
+    return len(self.hash_fns)
+
+  @property
+  def words_per_part(self) -> int:
+    return -(-self.len_per_part // 64)
+
+  def __call__(self) -> ParallelBloomFilter:
+    return ParallelBloomFilter(
+      words=np.zeros(self.num_parts * self.words_per_part, dtype=np.uint64),
+      hash_fns=self.hash_fns,
+      len_per_part=self.len_per_part,
+    )
+
+@dataclass(frozen=True)
+class CountingBloomFilterFamily:
+  """
+  Factory for empty CountingBloomFilters sharing the same hash functions (one per partition)
+  """
+  len_per_part: int
+  hash_fns: HashFamily
+  counter_bits: int = 4
+
+  def __post_init__(self):
+    assert self.counter_bits in COUNTER_BITS
+
+  def __call__(self) -> CountingBloomFilter:
+    counts = np.zeros(len(self.hash_fns) * self.len_per_part, dtype=np.uint8)
+    return CountingBloomFilter(counters=_pack_counters(counts, self.counter_bits), hash_fns=self.hash_fns,
+                               len_per_part=self.len_per_part, counter_bits=self.counter_bits)
+
+@dataclass(frozen=True)
+class ChunkedBloomFilterFamily:
+  """
+  Factory for empty ChunkedBloomFilters sharing the same hash functions (one per partition)
+  """
+  num_chunks: int
+  chunk_size: int
+  hash_fns: HashFamily
+
+  def __post_init__(self):
+    assert self.chunk_size % 64 == 0
+
+  def __call__(self) -> ChunkedBloomFilter:
+    num_parts = len(self.hash_fns)
+    return ChunkedBloomFilter(
+      words=np.zeros((self.num_chunks, num_parts, self.chunk_size // 64), dtype=np.uint64),
+      hash_fns=self.hash_fns,
+      obj_counts=np.zeros((num_parts, self.num_chunks), dtype=np.int64),
+      accesses=np.zeros(self.num_chunks, dtype=np.int64),
+    )
+
+def make_bloom_filter_family(len_signature: int, num_hashes: int, seed: int | None = None,
+                             hash_backend: HashBackend = "multiply_shift") -> BloomFilterFamily:
+  hash_fns = make_hash_backend_family(hash_backend, len_signature, num_hashes, seed)
+  return BloomFilterFamily(len_signature=len_signature, hash_fns=hash_fns)
+
+
+def make_bloom_filter(len_signature: int, num_hashes: int, seed: int | None = None,
+                      hash_backend: HashBackend = "multiply_shift") -> BloomFilter:
+  return make_bloom_filter_family(len_signature, num_hashes, seed, hash_backend)()
+
+
+def make_parallel_bloom_filter_family(len_signature: int, num_partitions: int, seed: int | None = None,
+                                      hash_backend: HashBackend = "multiply_shift") -> ParallelBloomFilterFamily:
+  """
+  hash_backend picks the hash functions: the model's own multiply-shift hashes, or one of the
+  hardware/simulator hashes in hashes.py so results reflect the exact hashing the FPGA uses
+  """
   assert len_signature % num_partitions == 0
   len_per_part = len_signature // num_partitions
-  part_families = [make_bloom_filter_family(len_per_part, 1) for _ in range(num_partitions)]
-  return lambda: ParallelBloomFilter(parts=[part_families[i]() for i in range(num_partitions)])
+  hash_fns = make_hash_backend_family(hash_backend, len_per_part, num_partitions, seed)
+  return ParallelBloomFilterFamily(len_per_part=len_per_part, hash_fns=hash_fns)
 
 
-def make_parallel_bloom_filter(len_signature: int, num_partitions: int) -> ParallelBloomFilter:
-  return make_parallel_bloom_filter_family(len_signature, num_partitions)()
+def make_parallel_bloom_filter(len_signature: int, num_partitions: int, seed: int | None = None,
+                               hash_backend: HashBackend = "multiply_shift") -> ParallelBloomFilter:
+  return make_parallel_bloom_filter_family(len_signature, num_partitions, seed, hash_backend)()
+
+
+def make_counting_bloom_filter_family(len_signature: int, num_partitions: int, seed: int | None = None,
+                                      hash_backend: HashBackend = "multiply_shift",
+                                      counter_bits: int = 4) -> CountingBloomFilterFamily:
+  """
+  Same hash functions as make_parallel_bloom_filter_family with the same arguments,
+  so the counting filter can track a running union of those signatures
+  """
+  assert len_signature % num_partitions == 0
+  len_per_part = len_signature // num_partitions
+  hash_fns = make_hash_backend_family(hash_backend, len_per_part, num_partitions, seed)
+  return CountingBloomFilterFamily(len_per_part=len_per_part, hash_fns=hash_fns, counter_bits=counter_bits)
+
+
+def make_counting_bloom_filter(len_signature: int, num_partitions: int, seed: int | None = None,
+                               hash_backend: HashBackend = "multiply_shift", counter_bits: int = 4) -> CountingBloomFilter:
+  return make_counting_bloom_filter_family(len_signature, num_partitions, seed, hash_backend, counter_bits)()
+
+
+def make_chunked_bloom_filter_family(num_parts: int = NUM_BLOOM_PARTS, num_chunks: int = NUM_BLOOM_CHUNKS,
+                                     chunk_size: int = BLOOM_CHUNK_SIZE, seed: int | None = None,
+                                     hash_backend: HashBackend = "txn_hasher") -> ChunkedBloomFilterFamily:
+  hash_fns = make_hash_backend_family(hash_backend, num_chunks * chunk_size, num_parts, seed, chunk_size=chunk_size)
+  return ChunkedBloomFilterFamily(num_chunks=num_chunks, chunk_size=chunk_size, hash_fns=hash_fns)
+
+
+def make_chunked_bloom_filter(num_parts: int = NUM_BLOOM_PARTS, num_chunks: int = NUM_BLOOM_CHUNKS,
+                              chunk_size: int = BLOOM_CHUNK_SIZE, seed: int | None = None,
+                              hash_backend: HashBackend = "txn_hasher") -> ChunkedBloomFilter:
+  return make_chunked_bloom_filter_family(num_parts, num_chunks, chunk_size, seed, hash_backend)()
 
 
-import random
 import itertools
 if __name__ == "__main__":
-  addr_space = list(range(2**20))
+  addr_space = np.arange(2**20)
   H = make_parallel_bloom_filter(1024, 4)
-  hashes = [H.parts[i].hash_fns[0] for i in range(4)]
   ref = set()
-  xs = []
-  ys = []
   for i in itertools.count():
     x = random.choice(addr_space)
     H.add(x)
     ref.add(x)
-    est = set(H.estimate_contents(addr_space))
-    extra = est.difference(ref)
-    print(i, len(extra))
-    xs.append(i)
-    ys.append(len(extra))
+    non_members = addr_space[~np.isin(addr_space, list(ref))]
+    sampled = H.sample_false_pos_rate(non_members, num_samples=100_000)
+    fill = " ".join(f"{r:.3f}" for r in H.fill_ratio())
+    print(i, f"fill=[{fill}]", f"analytic={H.estimate_false_pos_rate():.3e}",
+          f"sampled={sampled.rate:.3e} [{sampled.lower:.3e}, {sampled.upper:.3e}]")
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+"""
+Pairwise conflict detection for whole batches of transactions.
+Two transactions conflict under the same rule as Transaction.compat: one writes something the other reads or writes.
+Exact workloads go through an inverted object index; Bloom signatures are compared tile by tile with packed bitwise ANDs.
+"""
+
+from typing import *
+from dataclasses import dataclass
+import numpy as np
+
+from bloom_filter import ParallelBloomFilter, ParallelBloomFilterFamily
+from workload import Transaction, Workload, BinWorkload, SignatureMatrix
+
+DEFAULT_TILE_SIZE = 512
+
+ConflictInput = Workload | SignatureMatrix | Sequence[Transaction]
+
+def as_conflict_input(txns: ConflictInput) -> Workload | SignatureMatrix:
+  """
+  Columnar form of txns: a Workload for exact sets, a SignatureMatrix for ParallelBloomFilter signatures
+  """
+  if isinstance(txns, (Workload, SignatureMatrix)):
+    return txns
+  if isinstance(txns, BinWorkload):
+    return txns[:]
+  txns = list(txns)
+  if txns and isinstance(txns[0].read_set, ParallelBloomFilter):
+    sig = txns[0].read_set
+    family = ParallelBloomFilterFamily(len_per_part=sig.len_per_part, hash_fns=sig.hash_fns)
+    return SignatureMatrix(reads=np.stack([txn.read_set.words for txn in txns]),
+                           writes=np.stack([txn.write_set.words for txn in txns]),
+                           family=family)
+  return Workload.from_transactions(txns)
+
+@dataclass(frozen=True, eq=False)
+class ObjectIndex:
+  """
+  Inverted index of a workload in CSR form: distinct object objs[k] is accessed by the transactions
+  txns[offsets[k]:offsets[k+1]], readers first and then writers, each group in ascending order.
+  A transaction that both reads and writes an object appears once, as a writer.
+  """
+  objs: np.ndarray     # (num_objs,) distinct object IDs, ascending
+  offsets: np.ndarray  # (num_objs + 1,) int64
+  txns: np.ndarray     # (num_entries,) txn indices within the workload
+  writes: np.ndarray   # (num_entries,) bool
+  num_txns: int
+
+  @staticmethod
+  def from_workload(workload: Workload) -> "ObjectIndex":
+    rows = workload.rows
+    # Workload rows hold each (obj, write) once, so sorting by (obj, txn, write) leaves a txn's write last
+    order = np.lexsort((workload.writes, rows, workload.objs))
+    objs, rows, writes = workload.objs[order], rows[order], workload.writes[order]
+    last = np.ones(len(objs), dtype=np.bool_)
+    last[:-1] = (objs[1:] != objs[:-1]) | (rows[1:] != rows[:-1])
+    objs, rows, writes = objs[last], rows[last], writes[last]
+
+    order = np.lexsort((rows, writes, objs))
+    objs, rows, writes = objs[order], rows[order], writes[order]
+    starts = np.flatnonzero(np.r_[True, objs[1:] != objs[:-1]]) if len(objs) > 0 else np.zeros(0, dtype=np.int64)
+    return ObjectIndex(objs=objs[starts], offsets=np.r_[starts, len(objs)].astype(np.int64),
+                       txns=rows, writes=writes, num_txns=len(workload))
+
+  def __len__(self) -> int:
+    return len(self.objs)
+
+  def lookup(self, obj: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Transactions accessing obj and whether each writes it
+    """
+    k = np.searchsorted(self.objs, obj)
+    if k == len(self.objs) or self.objs[k] != obj:
+      return np.zeros(0, dtype=self.txns.dtype), np.zeros(0, dtype=np.bool_)
+    lo, hi = self.offsets[k], self.offsets[k + 1]
+    return self.txns[lo:hi], self.writes[lo:hi]
+
+  @property
+  def num_accessors(self) -> np.ndarray:
+    """
+    Number of transactions accessing each object
+    """
+    return np.diff(self.offsets)
+
+  @property
+  def num_writers(self) -> np.ndarray:
+    """
+    Number of transactions writing each object
+    """
+    counts = np.r_[0, np.cumsum(self.writes)]
+    return counts[self.offsets[1:]] - counts[self.offsets[:-1]]
+
+  @property
+  def num_conflict_pairs(self) -> np.ndarray:
+    """
+    Per object, the number of transaction pairs that conflict on it: every pair except reader-reader pairs
+    """
+    accessors, readers = self.num_accessors, self.num_accessors - self.num_writers
+    return accessors * (accessors - 1) // 2 - readers * (readers - 1) // 2
+
+  def conflict_edges(self, batch_pairs: int = 2**24) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Conflicting pairs (i < j), sorted and unique. Each writer is paired with the readers and earlier writers
+    of its group, so the work is proportional to the conflicting pairs, not to num_txns**2.
+    Pairs are expanded at most batch_pairs at a time to bound temporary memory.
+    """
+    if self.num_txns == 0:
+      return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    group_start = np.repeat(self.offsets[:-1], self.num_accessors)
+    num_partners = np.where(self.writes, np.arange(len(self.txns)) - group_start, 0)
+    ends = np.cumsum(num_partners)
+
+    keys = []
+    entry = 0
+    while entry < len(self.txns):
+      # Take entries until their partners fill the batch (always at least one entry)
+      stop = max(entry + 1, int(np.searchsorted(ends, ends[entry] - num_partners[entry] + batch_pairs, side='right')))
+      counts = num_partners[entry:stop]
+      first = np.repeat(np.arange(entry, stop), counts)
+      second = np.repeat(group_start[entry:stop], counts) + (np.arange(len(first)) - np.repeat(np.cumsum(counts) - counts, counts))
+      i, j = self.txns[first], self.txns[second]
+      keys.append(_unique_sorted(np.minimum(i, j).astype(np.int64) * self.num_txns + np.maximum(i, j)))
+      entry = stop
+
+    keys = _unique_sorted(np.concatenate(keys)) if keys else np.zeros(0, dtype=np.int64)
+    return keys // self.num_txns, keys % self.num_txns
+
+def _unique_sorted(keys: np.ndarray) -> np.ndarray:
+  keys = np.sort(keys)
+  return keys[np.r_[True, keys[1:] != keys[:-1]]] if len(keys) > 0 else keys
+
+def _word_major(sigs: SignatureMatrix) -> Tuple[np.ndarray, np.ndarray]:
+  """
+  (num_parts, words_per_part, num_txns) views of each txn's accessed and written words, so a tile is built from
+  contiguous row vectors instead of strided gathers
+  """
+  shape = (len(sigs), sigs.family.num_parts, sigs.family.words_per_part)
+  accessed = (sigs.reads | sigs.writes).reshape(shape).transpose(1, 2, 0)
+  written = sigs.writes.reshape(shape).transpose(1, 2, 0)
+  return np.ascontiguousarray(accessed), np.ascontiguousarray(written)
+
+def _conflict_tile(accessed: np.ndarray, written: np.ndarray, rows: slice, cols: slice) -> np.ndarray:
+  num_parts, words_per_part, _ = accessed.shape
+  tile = None
+  for p in range(num_parts):
+    # r1&w2 | w1&r2 | w1&w2 == (r1|w1)&w2 | w1&(r2|w2); OR it over the partition's words
+    overlap = None
+    for k in range(words_per_part):
+      words = (accessed[p, k, rows, None] & written[p, k, None, cols]) | (written[p, k, rows, None] & accessed[p, k, None, cols])
+      overlap = words if overlap is None else overlap | words
+    # A conflict needs an overlap in every partition
+    tile = overlap != 0 if tile is None else tile & (overlap != 0)
+  return tile
+
+def signature_conflict_tile(sigs: SignatureMatrix, rows: slice, cols: slice) -> np.ndarray:
+  """
+  Boolean (len(rows), len(cols)) block of the conflict matrix of sigs
+  """
+  return _conflict_tile(*_word_major(sigs), rows, cols)
+
+def iter_conflict_tiles(sigs: SignatureMatrix, tile_size: int = DEFAULT_TILE_SIZE) -> Iterator[Tuple[int, int, np.ndarray]]:
+  """
+  Upper-triangular tiles (row_start, col_start, tile) of the conflict matrix, so memory stays O(tile_size**2)
+  """
+  accessed, written = _word_major(sigs)
+  for row_start in range(0, len(sigs), tile_size):
+    rows = slice(row_start, min(row_start + tile_size, len(sigs)))
+    for col_start in range(row_start, len(sigs), tile_size):
+      cols = slice(col_start, min(col_start + tile_size, len(sigs)))
+      yield row_start, col_start, _conflict_tile(accessed, written, rows, cols)
+
+def conflict_edges(txns: ConflictInput, tile_size: int = DEFAULT_TILE_SIZE) -> Tuple[np.ndarray, np.ndarray]:
+  """
+  Sparse conflict matrix: sorted, unique index pairs (i, j) with i < j such that txns[i] and txns[j] conflict
+  """
+  txns = as_conflict_input(txns)
+  if isinstance(txns, Workload):
+    return ObjectIndex.from_workload(txns).conflict_edges()
+
+  all_i, all_j = [], []
+  for row_start, col_start, tile in iter_conflict_tiles(txns, tile_size):
+    i, j = np.nonzero(tile)
+    i, j = i + row_start, j + col_start
+    keep = i < j
+    all_i.append(i[keep])
+    all_j.append(j[keep])
+  if not all_i:
+    return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+  i, j = np.concatenate(all_i), np.concatenate(all_j)
+  order = np.lexsort((j, i))
+  return i[order].astype(np.int64), j[order].astype(np.int64)
+
+def conflict_matrix(txns: ConflictInput, tile_size: int = DEFAULT_TILE_SIZE, sparse: bool = False
+                    ) -> np.ndarray | Tuple[np.ndarray, np.ndarray]:
+  """
+  Symmetric boolean N x N conflict matrix (diagonal False), or with sparse=True the (i, j), i < j, pairs from conflict_edges
+  """
+  if sparse:
+    return conflict_edges(txns, tile_size)
+  txns = as_conflict_input(txns)
+  n = len(txns)
+  matrix = np.zeros((n, n), dtype=np.bool_)
+  if isinstance(txns, Workload):
+    i, j = ObjectIndex.from_workload(txns).conflict_edges()
+    matrix[i, j] = True
+  else:
+    for row_start, col_start, tile in iter_conflict_tiles(txns, tile_size):
+      matrix[row_start:row_start + tile.shape[0], col_start:col_start + tile.shape[1]] = tile
+    matrix = np.triu(matrix, k=1)
+  return matrix | matrix.T
+
+def conflict_degrees(txns: ConflictInput, tile_size: int = DEFAULT_TILE_SIZE) -> np.ndarray:
+  """
+  Number of other transactions each transaction conflicts with
+  """
+  n = len(txns)
+  i, j = conflict_edges(txns, tile_size)
+  return np.bincount(i, minlength=n) + np.bincount(j, minlength=n)
+
+if __name__ == "__main__":
+  from bloom_filter import make_parallel_bloom_filter_family
+  from workload import make_workload, compress_workload
+
+  workload = make_workload(2**20, 2**12, 16, 0.8, 0.5)
+  signatures = compress_workload(workload, make_parallel_bloom_filter_family(1024, 4))
+  for name, txns in [("exact", workload), ("bloom", signatures)]:
+    degrees = conflict_degrees(txns)
+    print(f"{name}: {degrees.sum() // 2} conflicting pairs, mean degree {degrees.mean():.2f}, max {degrees.max()}")
@@ -11,47 +11,98 @@ import matplotlib.pyplot as plt
 from matplotlib.ticker import FuncFormatter
 
 from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
 from typing import *
 
-from bloom_filter import Set, make_bloom_filter, make_parallel_bloom_filter
-
-def get_false_pos_rate(addr_space: list[int], num_elems: int, len_signature: int, num_partitions: int):
-  random.seed(1357924680)
-  ft: Set = make_parallel_bloom_filter(len_signature, num_partitions)
-
-  for i in range(num_elems):
-    elem = addr_space[i]
-    ft.add(elem)
-
-  num_false_pos = 0
-  num_samples = len(addr_space) - num_elems
-  for i in range(num_elems, len(addr_space)):
-    elem = addr_space[i]
-    if elem in ft:
-      num_false_pos += 1
-  false_pos_rate = num_false_pos / num_samples
-
-  return false_pos_rate
-
-def get_data_for_config(len_signature: int, num_partitions: int) -> Tuple[np.array, np.array, str]:
-  print(f"  m={len_signature}, k={num_partitions}", file=sys.stderr)
+from bloom_filter import Set, HashBackend, hash_family_many, make_bloom_filter, make_parallel_bloom_filter
+from workload import attach_untracked
+
+# "exact" counts false positives over every non-inserted address; "analytic" derives the rate from the fill ratio.
+FPR_METHOD: Literal["exact", "analytic"] = "exact"
+
+# Every config draws its hash family from this seed
+HASH_SEED = 1357924680
+
+# Use e.g. "txn_hasher" to plot the rates of the hash the FPGA uses
+HASH_BACKEND: HashBackend = "multiply_shift"
+
+def get_false_pos_curve(addr_space: np.ndarray, num_elems_arr: np.ndarray, len_signature: int, num_partitions: int,
+                        method: Literal["exact", "analytic"] = "exact") -> np.ndarray:
+  """
+  False positive rate after inserting each prefix addr_space[:n] for n in num_elems_arr, computed in one pass.
+  Bits are only ever set, so each bit has a first-set time (the index of the first inserted address hashing to it),
+  and an address becomes a positive once the last of its bits is set. For any n, every inserted address is
+  positive, so the false positives among addr_space[n:] are (#addresses positive before time n) - n.
+  """
+  ft = make_parallel_bloom_filter(len_signature, num_partitions, seed=HASH_SEED, hash_backend=HASH_BACKEND)
+  len_addr_space = len(addr_space)
+  max_elems = int(np.max(num_elems_arr))
+
+  positive_time = np.zeros(len_addr_space, dtype=np.int64)
+  fill_ratios = []
+  for positions in hash_family_many(ft.hash_fns, addr_space).astype(np.intp):
+    first_set = np.full(ft.len_per_part, len_addr_space, dtype=np.int64)
+    buckets, first_idx = np.unique(positions[:max_elems], return_index=True)
+    first_set[buckets] = first_idx
+    if method == "exact":
+      np.maximum(positive_time, first_set[positions], out=positive_time)
+    else:
+      first_set.sort()
+      fill_ratios.append(np.searchsorted(first_set, num_elems_arr) / ft.len_per_part)
+
+  if method == "analytic":
+    return np.prod(fill_ratios, axis=0)
+  positive_time.sort()
+  num_positive = np.searchsorted(positive_time, num_elems_arr)
+  return (num_positive - num_elems_arr) / (len_addr_space - num_elems_arr)
+
+def _get_false_pos_curve_shared(shm_name: str, len_addr_space: int, num_elems_arr: np.ndarray,
+                                len_signature: int, num_partitions: int, method: Literal["exact", "analytic"]):
+  shm = attach_untracked(shm_name)
+  addr_space = None
+  try:
+    # frombuffer (unlike np.ndarray(buffer=...)) pins the buffer, so close() fails instead of unmapping a live view
+    addr_space = np.frombuffer(shm.buf, dtype=np.int64, count=len_addr_space)
+    rates = get_false_pos_curve(addr_space, num_elems_arr, len_signature, num_partitions, method)
+  finally:
+    del addr_space
+    try:
+      shm.close()
+    except BufferError:
+      pass  # a traceback still holds a view; the mapping is released with it
+  return rates
+
+def get_data_for_configs(configs: list[Tuple[int, int]]) -> list[Tuple[np.array, np.array, str]]:
+  """
+  Sweep all (m, k) configs in parallel. Workers share one shuffled address space through shared memory.
+  """
   max_log = 20
   len_addr_space = 2**max_log
   num_elems_arr = np.rint(2**np.arange(0, 14, 1.0/4.0)).astype(int)
-  addr_space = list(range(len_addr_space))
-  random.shuffle(addr_space)
-
-  with tqdm.tqdm(total=len(num_elems_arr)) as progress:
-    with ProcessPoolExecutor() as pool:
-      futures = []
-      for num_elems in num_elems_arr:
-        future = pool.submit(get_false_pos_rate, addr_space, num_elems, len_signature, num_partitions)
-        future.add_done_callback(lambda _: progress.update())
-        futures.append(future)
-      rates = [future.result() for future in futures]
 
-  rates = np.array(rates)
-  return (num_elems_arr, rates, f'm={len_signature}, k={num_partitions}')
+  shm = SharedMemory(create=True, size=len_addr_space * np.dtype(np.int64).itemsize)
+  addr_space = None
+  try:
+    addr_space = np.frombuffer(shm.buf, dtype=np.int64, count=len_addr_space)
+    addr_space[:] = np.random.permutation(len_addr_space)
+
+    with tqdm.tqdm(total=len(configs)) as progress:
+      with ProcessPoolExecutor() as pool:
+        futures = []
+        for len_signature, num_partitions in configs:
+          print(f"  m={len_signature}, k={num_partitions}", file=sys.stderr)
+          future = pool.submit(_get_false_pos_curve_shared, shm.name, len_addr_space, num_elems_arr,
+                               len_signature, num_partitions, FPR_METHOD)
+          future.add_done_callback(lambda _: progress.update())
+          futures.append(future)
+        curves = [future.result() for future in futures]
+  finally:
+    del addr_space
+    shm.close()
+    shm.unlink()
+
+  return [(num_elems_arr, rates, f'm={len_signature}, k={num_partitions}')
+          for (len_signature, num_partitions), rates in zip(configs, curves)]
 
 def graph_false_pos_rate():
   plt.rcParams.update({'figure.autolayout': True})
@@ -92,7 +143,7 @@ def graph_false_pos_rate():
     #   formatter = FuncFormatter(lambda y, _: '{:.8g}'.format(y))
     #  axis.set_major_formatter(formatter)
 
-    for x, y, label in map(get_data_for_config, *zip(*config_arr)):
+    for x, y, label in get_data_for_configs(config_arr):
       ax.plot(x, y, '-', label=label)
 
     ax.legend()
@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 
+import os
 import time
 import itertools
 import sys
@@ -9,68 +10,131 @@ import functools
 
 from typing import *
 from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
 
-from workload import Transaction, make_workload
+from workload import Transaction, make_workload, make_zipf_sampler, attach_zipf_cache, chunk_seed, ZIPF_CACHE
 from scheduler import Scheduler, GreedyScheduler, TournamentScheduler
 
 SchedType = Literal["greedy", "tournament"]
 SCHED_TYPES = ["greedy", "tournament"]
 
+# "scheduled": size of the first batch; "parallelism": mean batch size when draining the whole workload
+Metric = Literal["scheduled", "parallelism"]
+
 NUM_OBJS_PER_TXN = 8  # For my thesis figures, I manually ran with 8 and then with 16.
 NUM_TXNS = 2**10      # For my thesis figures, I used 2**12.
 LOG_SIM_BOUND = 12    # For my thesis figures, I used 25. It takes a very long time, but makes the plots more accurate.
 
-def _get_num_txns_scheduled(mem_size: int, zipf_param: float, write_prob: float, sched_type: SchedType):
-  addr_space = np.arange(mem_size)
-  workload = list(make_workload(addr_space, NUM_TXNS, NUM_OBJS_PER_TXN, zipf_param, write_prob))
+NUM_TRIALS = 10
+WORKLOAD_TYPES = [('Read-heavy', 0.05), ('Write-heavy', 0.50)]
+THETAS = [0.0, 0.6, 0.8]
+
+@dataclass(frozen=True)
+class SweepPoint:
+  mem_size: int
+  zipf_param: float
+  write_prob: float
+  sched_type: SchedType
+  metric: Metric = "scheduled"
 
-  s: Scheduler
+def _make_scheduler(sched_type: SchedType) -> Scheduler:
   if sched_type == "greedy":
-    s = GreedyScheduler()
+    return GreedyScheduler()
   elif sched_type == "tournament":
-    s = TournamentScheduler()
+    return TournamentScheduler()
+  raise Exception(f"Unknown scheduler type {sched_type}")
 
+def _run_trial(point: SweepPoint, seed: np.random.SeedSequence) -> float:
+  # An int address space stands for range(mem_size), so large N costs no per-task allocation
+  workload = make_workload(point.mem_size, NUM_TXNS, NUM_OBJS_PER_TXN, point.zipf_param, point.write_prob,
+                           np.random.default_rng(seed))
+  s = _make_scheduler(point.sched_type)
+  if point.metric == "parallelism":
+    return s.drain(workload).parallelism
   return len(s.schedule(workload))
 
-def get_num_txns_scheduled(mem_size: float, zipf_param: float, write_prob: float, sched_type: SchedType):
-  num_trials = 10
-  with ProcessPoolExecutor() as exec:
-    y = list(exec.map(_get_num_txns_scheduled,
-                      [mem_size] * num_trials,
-                      [zipf_param] * num_trials,
-                      [write_prob] * num_trials,
-                      [sched_type] * num_trials))
-  return np.mean(y, axis=0)
-
-def graph_scale_num_objs():
+def make_sweep_pool(points: Iterable[SweepPoint], num_workers: int | None = None) -> ProcessPoolExecutor:
+  """
+  One long-lived pool for a whole sweep. Every Zipf CDF the points need is built first, in shared memory,
+  so workers attach them all at startup instead of each computing private copies.
+  """
+  for mem_size, zipf_param in sorted({(p.mem_size, p.zipf_param) for p in points}):
+    make_zipf_sampler(mem_size, zipf_param)
+  return ProcessPoolExecutor(num_workers, initializer=attach_zipf_cache, initargs=(ZIPF_CACHE.handles(),))
+
+def run_sweep(pool: ProcessPoolExecutor, points: Sequence[SweepPoint], num_trials: int = NUM_TRIALS,
+              seed: int | np.random.SeedSequence | None = None, chunksize: int | None = None) -> np.ndarray:
+  """
+  Mean metric over num_trials for every point. All (point, trial) tasks go to the pool at once, in chunks of several tasks.
+  Trial t draws its workload from the t-th child of seed at every point, so points are compared on common random numbers
+  and results do not depend on the grid or the number of workers.
+  """
+  seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+  tasks = list(itertools.product(points, range(num_trials)))
+  if chunksize is None:
+    chunksize = max(1, len(tasks) // (4 * (os.cpu_count() or 1)))
+  y = list(pool.map(_run_trial,
+                    [point for point, _ in tasks],
+                    [chunk_seed(seed, trial) for _, trial in tasks],
+                    chunksize=chunksize))
+  return np.array(y, dtype=np.float64).reshape(len(points), num_trials).mean(axis=1)
+
+def get_num_txns_scheduled(mem_size: int, zipf_param: float, write_prob: float, sched_type: SchedType,
+                           metric: Metric = "scheduled", num_trials: int = NUM_TRIALS) -> float:
+  points = [SweepPoint(mem_size, zipf_param, write_prob, sched_type, metric)]
+  with make_sweep_pool(points) as pool:
+    return float(run_sweep(pool, points, num_trials)[0])
+
+def scale_num_objs_points(metric: Metric = "scheduled") -> list[SweepPoint]:
+  """
+  The full grid behind graph_scale_num_objs, in plotting order
+  """
+  return [SweepPoint(int(mem_size), theta, omega, sched_type, metric)
+          for _, omega in WORKLOAD_TYPES
+          for sched_type in SCHED_TYPES
+          for theta in THETAS
+          for mem_size in 2**np.arange(10, LOG_SIM_BOUND, 1)]
+
+def graph_scale_num_objs(metric: Metric = "scheduled", pool: ProcessPoolExecutor | None = None):
+  if pool is None:
+    with make_sweep_pool(scale_num_objs_points(metric)) as pool:
+      return graph_scale_num_objs(metric, pool)
+
   plt.rcParams.update({'figure.autolayout': True})
+  prefix = "output-scheduler" if metric == "scheduled" else "output-drain"
+
+  points = scale_num_objs_points(metric)
+  begin = time.time()
+  results = dict(zip(points, run_sweep(pool, points)))
+  print(f"Swept {len(points)} points in {time.time()-begin} seconds", file=sys.stderr)
 
-  for workload_type, omega in [('Read-heavy', 0.05), ('Write-heavy', 0.50)]:
-    filename = f"output-scheduler-{workload_type.lower()}-{NUM_TXNS}x{NUM_OBJS_PER_TXN}.svg"
+  for workload_type, omega in WORKLOAD_TYPES:
+    filename = f"{prefix}-{workload_type.lower()}-{NUM_TXNS}x{NUM_OBJS_PER_TXN}.svg"
     print(f"Rendering: {filename}", file=sys.stderr)
-    begin = time.time()
     plt.figure(figsize=(6 * 3/4, 4 * 3/4), dpi=200)
     plt.title(f"{workload_type}: {NUM_OBJS_PER_TXN} objs/txn, $\\omega = {omega:.2f}$")
     plt.xlabel("Number of records ($N$)")
-    plt.ylabel(f"Scheduled (max: {NUM_TXNS})")
+    if metric == "scheduled":
+      plt.ylabel(f"Scheduled (max: {NUM_TXNS})")
+    else:
+      plt.ylabel("Parallelism (txns per round)")
     plt.xscale("log", base=2)
     plt.yscale("linear")
     plt.grid()
 
     for sched_type, line in zip(SCHED_TYPES, ["--", "-"]):
-      for theta in [0.0, 0.6, 0.8]:
+      for theta in THETAS:
         x = 2**np.arange(10,LOG_SIM_BOUND,1)
-        y = np.array(list(map(get_num_txns_scheduled,
-                              x,
-                              itertools.repeat(theta),
-                              itertools.repeat(omega),
-                              itertools.repeat(sched_type))))
+        y = np.array([results[SweepPoint(int(mem_size), theta, omega, sched_type, metric)] for mem_size in x])
         plt.plot(x, y, line, label=f"$\\theta = {theta}$, {sched_type}")
 
     plt.legend()
-    end = time.time()
-    print(f"Done: {filename} {end-begin} seconds", file=sys.stderr)
     plt.savefig(filename, bbox_inches="tight")
+    print(f"Done: {filename}", file=sys.stderr)
 
 if __name__ == "__main__":
-  graph_scale_num_objs()
+  metrics: list[Metric] = ["scheduled", "parallelism"]
+  # One pool for every figure; its workers stay up between sweeps
+  with make_sweep_pool([p for metric in metrics for p in scale_num_objs_points(metric)]) as pool:
+    for metric in metrics:
+      graph_scale_num_objs(metric, pool)
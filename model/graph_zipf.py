@@ -11,16 +11,10 @@ def graph_zipf():
   plt.grid()
 
   # The figure in my thesis used 10_000_000
-  num_records = 1000000
+  num_records = 10_000_000
   top_k = int(num_records * 0.1)
   thetas = np.linspace(0.0, 1.3, num=100)
-  top_k_fractions = []
-
-  for theta in thetas:
-    weights = make_zipf_weights(num_records, theta)
-    weights /= weights.sum()
-    top_k_fraction = weights[:top_k].sum()
-    top_k_fractions.append(top_k_fraction)
+  top_k_fractions = [zipf_top_k_mass(top_k, num_records, theta) for theta in thetas]
 
   plt.plot(thetas, top_k_fractions)
   plt.xlabel("Zipf parameter θ")
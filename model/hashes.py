@@ -0,0 +1,319 @@
+"""
+Hash families for the model's Bloom filters.
+
+Every family maps an array of object ids to one row of bucket indices per hash function (hash_many),
+and indexing a family gives a scalar hash function. Besides the model's own multiply-shift hashes,
+this includes bit-exact vectorized versions of the hashes used by the hardware and the software simulator.
+"""
+
+from typing import *
+from dataclasses import dataclass
+import numpy as np
+import random
+import math
+import abc
+
+class HashFamily(abc.ABC):
+  buckets: int
+
+  def __len__(self) -> int:
+    raise NotImplementedError
+
+  def hash_many(self, elems: np.ndarray) -> np.ndarray:
+    """
+    Bucket index of every element under every hash function, shape (len(self), len(elems))
+    """
+    raise NotImplementedError
+
+  def __getitem__(self, i: int) -> Callable[[int], int]:
+    if not 0 <= i < len(self):
+      raise IndexError(i)
+    return FamilyMember(family=self, index=i)
+
+  def __iter__(self) -> Iterator[Callable[[int], int]]:
+    return (self[i] for i in range(len(self)))
+
+@dataclass(frozen=True)
+class FamilyMember:
+  """
+  Scalar view of one hash function in a family
+  """
+  family: HashFamily
+  index: int
+
+  def __call__(self, x: int) -> int:
+    return int(self.hash_many(np.array([x]))[0])
+
+  def hash_many(self, elems: np.ndarray) -> np.ndarray:
+    return self.family.hash_many(elems)[self.index]
+
+_U32_MASK = np.uint64(2**32 - 1)
+_U32_SHIFT = np.uint64(32)
+
+def multiply_shift_many(elems: np.ndarray, mult: int | np.ndarray, shift: int, buckets: int) -> np.ndarray:
+  """
+  Vectorized (x * mult) // 2**shift % buckets over an array of non-negative integers below 2**64.
+  mult may be an array of multipliers below 2**64, broadcast against elems.
+  The full 128-bit product is formed from 32-bit limbs so results match Python's unbounded integers exactly.
+  """
+  assert 0 <= shift < 128 and 0 < buckets <= 2**32
+  x = np.asarray(elems).astype(np.uint64)
+  m = np.asarray(mult, dtype=np.uint64)
+  x_lo, x_hi = x & _U32_MASK, x >> _U32_SHIFT
+  m_lo, m_hi = m & _U32_MASK, m >> _U32_SHIFT
+
+  # Schoolbook multiplication; every partial product fits in 64 bits
+  ll = x_lo * m_lo
+  lh = x_lo * m_hi
+  hl = x_hi * m_lo
+  mid = (ll >> _U32_SHIFT) + (lh & _U32_MASK) + (hl & _U32_MASK)
+  lo = (ll & _U32_MASK) | (mid << _U32_SHIFT)
+  hi = x_hi * m_hi + (lh >> _U32_SHIFT) + (hl >> _U32_SHIFT) + (mid >> _U32_SHIFT)
+
+  # Shift the 128-bit product (hi, lo) right
+  if shift == 0:
+    q_lo, q_hi = lo, hi
+  elif shift < 64:
+    q_lo = (lo >> np.uint64(shift)) | (hi << np.uint64(64 - shift))
+    q_hi = hi >> np.uint64(shift)
+  else:
+    q_lo, q_hi = hi >> np.uint64(shift - 64), np.zeros_like(hi)
+
+  # Reduce q_hi * 2**64 + q_lo modulo buckets without overflowing
+  if buckets & (buckets - 1) == 0:
+    return q_lo & np.uint64(buckets - 1)
+  b = np.uint64(buckets)
+  return ((q_hi % b) * np.uint64(2**64 % buckets) % b + q_lo % b) % b
+
+def hash_many(fn: Callable[[int], int], elems: np.ndarray) -> np.ndarray:
+  """
+  Apply a hash function to every element, using its vectorized form if it has one
+  """
+  if hasattr(fn, "hash_many"):
+    return fn.hash_many(elems)
+  return np.fromiter((fn(int(elem)) for elem in elems), dtype=np.uint64, count=len(elems))
+
+def hash_family_many(fns: Sequence[Callable[[int], int]], elems: np.ndarray) -> np.ndarray:
+  """
+  Apply every hash function to every element. Returns one row per hash function.
+  """
+  if hasattr(fns, "hash_many"):
+    return fns.hash_many(elems)
+  return np.stack([hash_many(fn, elems) for fn in fns]).reshape(len(fns), len(elems))
+
+@dataclass(frozen=True)
+class MultiplyShiftHash:
+  """
+  h(x) = (x * mult) // 2**shift % buckets
+  """
+  mult: int
+  buckets: int
+  shift: int = 35
+
+  def __call__(self, x: int) -> int:
+    return (int(x) * self.mult) // 2**self.shift % self.buckets
+
+  def hash_many(self, elems: np.ndarray) -> np.ndarray:
+    return multiply_shift_many(elems, self.mult, self.shift, self.buckets)
+
+@dataclass(frozen=True)
+class MultiplyShiftHashFamily(HashFamily):
+  """
+  A sequence of multiply-shift hashes sharing the same shift and bucket count.
+  Plain data, so it pickles cheaply, compares by value and can key caches.
+  seed records how the multipliers were drawn (None if drawn from the global random state).
+  """
+  mults: tuple[int, ...]
+  buckets: int
+  shift: int = 35
+  seed: int | None = None
+
+  def __len__(self) -> int:
+    return len(self.mults)
+
+  def __getitem__(self, i: int) -> MultiplyShiftHash:
+    return MultiplyShiftHash(mult=self.mults[i], buckets=self.buckets, shift=self.shift)
+
+  def hash_many(self, elems: np.ndarray) -> np.ndarray:
+    mults = np.array(self.mults, dtype=np.uint64)
+    return multiply_shift_many(np.asarray(elems)[None, :], mults[:, None], self.shift, self.buckets)
+
+def make_hash_function(buckets: int, rng: random.Random | None = None) -> MultiplyShiftHash:
+  randint = rng.randint if rng is not None else random.randint
+  mult = randint(2**40, 2**50)*2 + 1
+  return MultiplyShiftHash(mult=mult, buckets=buckets)
+
+def make_hash_family(buckets: int, num_hashes: int, seed: int | None = None) -> MultiplyShiftHashFamily:
+  """
+  Draw num_hashes multipliers. The same seed always gives the same family;
+  without a seed, multipliers come from the global random state as before.
+  """
+  rng = random.Random(seed) if seed is not None else None
+  mults = tuple(make_hash_function(buckets, rng).mult for _ in range(num_hashes))
+  return MultiplyShiftHashFamily(mults=mults, buckets=buckets, seed=seed)
+
+def _log2_exact(n: int) -> int:
+  assert n > 0 and n & (n - 1) == 0, f"{n} is not a power of two"
+  return n.bit_length() - 1
+
+def _as_obj_ids(elems: np.ndarray) -> np.ndarray:
+  # Object ids are 32 bits wide in hardware
+  return np.asarray(elems).astype(np.uint64) & _U32_MASK
+
+def fibonacci_constant(n_bits: int) -> int:
+  """
+  Odd integer closest below 2**n_bits / golden ratio, computed the same way as TxnHasher.bsv
+  """
+  return int(float(2**n_bits) / (1.0 + math.sqrt(5.0)) * 2.0) | 1
+
+def fibonacci_hash_many(elems: np.ndarray, n_bits: int) -> np.ndarray:
+  """
+  (obj * fibonacci_constant(n_bits)) mod 2**n_bits
+  """
+  assert 0 < n_bits <= 64
+  full = _as_obj_ids(elems) * np.uint64(fibonacci_constant(n_bits))
+  if n_bits < 64:
+    full &= np.uint64(2**n_bits - 1)
+  return full
+
+def _gather_bits(full: np.ndarray, positions: list[int]) -> np.ndarray:
+  res = np.zeros_like(full)
+  for i, pos in enumerate(positions):
+    res |= ((full >> np.uint64(pos)) & np.uint64(1)) << np.uint64(i)
+  return res
+
+ORIGINAL_HASH_SEEDS = (0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D, 0x27D4EB2F)
+
+def _rotl32(value: np.ndarray, amount: int) -> np.ndarray:
+  return (value << np.uint32(amount)) | (value >> np.uint32(32 - amount))
+
+def original_part_hash_many(elems: np.ndarray, seed: int) -> np.ndarray:
+  """
+  Vectorized original_part_hash from new-hash/hashes.py (11-bit result)
+  """
+  obj = _as_obj_ids(elems).astype(np.uint32)
+  byte = lambda i: (obj >> np.uint32(8 * i)) & np.uint32(0xFF)
+  h = np.full(obj.shape, seed, dtype=np.uint32)
+  h = _rotl32(h ^ byte(0), 5)
+  h = _rotl32(h ^ byte(1), 11)
+  h = _rotl32(h ^ byte(2), 18)
+  h = h ^ byte(3)
+
+  lower = h & np.uint32(0x7FF)
+  upper = (h >> np.uint32(11)) & np.uint32(0x1FFFFF)
+  lower ^= upper & np.uint32(0x7FF)
+  lower ^= upper >> np.uint32(10)
+  return (
+    ((lower & np.uint32(0xFF)) << np.uint32(3)) | (lower >> np.uint32(8))
+  ) ^ (((lower & np.uint32(0x7)) << np.uint32(8)) | (lower >> np.uint32(3)))
+
+@dataclass(frozen=True)
+class OriginalHashFamily(HashFamily):
+  """
+  Byte-mixing hash from new-hash/hashes.py, one hardware seed per hash function.
+  The hash is 11 bits wide; smaller power-of-two bucket counts keep its low bits.
+  """
+  buckets: int
+  seeds: tuple[int, ...] = ORIGINAL_HASH_SEEDS
+
+  def __post_init__(self):
+    assert _log2_exact(self.buckets) <= 11
+
+  def __len__(self) -> int:
+    return len(self.seeds)
+
+  def hash_many(self, elems: np.ndarray) -> np.ndarray:
+    rows = [original_part_hash_many(elems, seed) & np.uint32(self.buckets - 1) for seed in self.seeds]
+    return np.stack(rows).astype(np.uint64).reshape(len(self), -1)
+
+@dataclass(frozen=True)
+class InterleavedFibonacciHashFamily(HashFamily):
+  """
+  make_interleaved_fibonacci_hashes from new-hash/hashes.py: one Fibonacci hash of
+  num_hashes * log2(buckets) bits, where hash i takes bits i, i + num_hashes, i + 2*num_hashes, ...
+  """
+  buckets: int
+  num_hashes: int
+
+  def __len__(self) -> int:
+    return self.num_hashes
+
+  def hash_many(self, elems: np.ndarray) -> np.ndarray:
+    index_length = _log2_exact(self.buckets)
+    full = fibonacci_hash_many(elems, self.num_hashes * index_length)
+    rows = [_gather_bits(full, [i + j * self.num_hashes for j in range(index_length)]) for i in range(self.num_hashes)]
+    return np.stack(rows).reshape(len(self), -1)
+
+@dataclass(frozen=True)
+class TxnHasherHashFamily(HashFamily):
+  """
+  hashObject from new-pmhw/src/TxnHasher.bsv. Part i takes its bit index from bits i + j*NumBloomParts
+  of the Fibonacci hash and its chunk index from bits i + j*NumBloomParts + log2(BloomChunkSize).
+  The bucket is chunk index * chunk_size + bit index.
+  """
+  buckets: int
+  num_hashes: int
+  chunk_size: int = 256
+
+  def __len__(self) -> int:
+    return self.num_hashes
+
+  def hash_many(self, elems: np.ndarray) -> np.ndarray:
+    chunk_bits = _log2_exact(self.chunk_size)
+    num_chunk_idx_bits = _log2_exact(self.buckets) - chunk_bits
+    assert num_chunk_idx_bits >= 0
+    n = self.num_hashes
+    full = fibonacci_hash_many(elems, n * (num_chunk_idx_bits + chunk_bits))
+    rows = []
+    for i in range(n):
+      bit_idx = _gather_bits(full, [j * n + i for j in range(chunk_bits)])
+      chunk_idx = _gather_bits(full, [j * n + i + chunk_bits for j in range(num_chunk_idx_bits)])
+      rows.append(chunk_idx * np.uint64(self.chunk_size) + bit_idx)
+    return np.stack(rows).reshape(len(self), -1)
+
+BLOOM_H_CONSTANTS = (
+  0x9e3779b97f4a7c15, 0xc6a4a7935bd1e995,
+  0x2545f4914f6cdd1d, 0x21c64e4276c9f809,
+  0x5851f42d4c957f2d, 0xda942042e4dd58b5,
+  0x14057b7ef767814f, 0x2f8b15c6c8b3a3c5,
+)
+
+@dataclass(frozen=True)
+class BloomHHashFamily(HashFamily):
+  """
+  bloom_hash from wrapper/include/bloom.h: ((x * constant) mod 2**64 >> 46) % buckets
+  """
+  buckets: int
+  num_hashes: int
+
+  def __post_init__(self):
+    assert self.num_hashes <= len(BLOOM_H_CONSTANTS)
+
+  def __len__(self) -> int:
+    return self.num_hashes
+
+  def hash_many(self, elems: np.ndarray) -> np.ndarray:
+    x = np.asarray(elems).astype(np.uint64)[None, :]
+    consts = np.array(BLOOM_H_CONSTANTS[:self.num_hashes], dtype=np.uint64)[:, None]
+    return ((x * consts) >> np.uint64(46)) % np.uint64(self.buckets)
+
+HashBackend = Literal["multiply_shift", "original", "interleaved_fibonacci", "txn_hasher", "bloom_h"]
+
+def make_hash_backend_family(backend: HashBackend, buckets: int, num_hashes: int, seed: int | None = None,
+                             chunk_size: int = 256) -> HashFamily:
+  """
+  Hash family for a named backend. Only multiply_shift is randomized (by seed); the others are fixed functions.
+  chunk_size is the BloomChunkSize assumed by txn_hasher.
+  """
+  if backend == "multiply_shift":
+    return make_hash_family(buckets, num_hashes, seed)
+  elif backend == "original":
+    assert num_hashes <= len(ORIGINAL_HASH_SEEDS)
+    return OriginalHashFamily(buckets=buckets, seeds=ORIGINAL_HASH_SEEDS[:num_hashes])
+  elif backend == "interleaved_fibonacci":
+    return InterleavedFibonacciHashFamily(buckets=buckets, num_hashes=num_hashes)
+  elif backend == "txn_hasher":
+    return TxnHasherHashFamily(buckets=buckets, num_hashes=num_hashes, chunk_size=chunk_size)
+  elif backend == "bloom_h":
+    return BloomHHashFamily(buckets=buckets, num_hashes=num_hashes)
+  raise ValueError(f"Unknown hash backend {backend!r}")
@@ -1,36 +1,302 @@
 from typing import *
-from workload import Transaction, make_workload, compress_workload
-from bloom_filter import Set, make_parallel_bloom_filter_family
+from workload import Transaction, Workload, SignatureMatrix, make_workload, compress_workload
+from bloom_filter import Set, CountingBloomFilter, CountingBloomFilterFamily, counter_bits_for, make_parallel_bloom_filter_family
+from hashes import make_hash_function
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, replace
+from collections import defaultdict, deque, Counter
 import itertools
+import random
 import copy
+import numpy as np
 
 from abc import ABC
 
+@dataclass(frozen=True)
+class DrainResult:
+  """
+  Outcome of scheduling a whole workload in rounds: rounds[i] is the round in which txns[i] ran
+  """
+  rounds: np.ndarray
+
+  @property
+  def num_rounds(self) -> int:
+    return int(self.rounds.max()) + 1 if len(self.rounds) > 0 else 0
+
+  @property
+  def batch_sizes(self) -> np.ndarray:
+    """
+    Number of transactions scheduled in each round
+    """
+    return np.bincount(self.rounds, minlength=self.num_rounds)
+
+  @property
+  def parallelism(self) -> float:
+    """
+    Effective parallelism: mean number of transactions per round
+    """
+    return len(self.rounds) / self.num_rounds if self.num_rounds > 0 else 0.0
+
+  def batch_size_histogram(self) -> np.ndarray:
+    """
+    hist[s] is the number of rounds that scheduled exactly s transactions
+    """
+    return np.bincount(self.batch_sizes)
+
+  def batches(self) -> list[np.ndarray]:
+    """
+    Indices of the transactions scheduled in each round, ascending
+    """
+    order = np.argsort(self.rounds, kind="stable")
+    return np.split(order, np.cumsum(self.batch_sizes)[:-1])
+
 class Scheduler(ABC):
-  def schedule(self: Self, txns: list[Transaction]) -> list[Transaction]:
+  def schedule(self: Self, txns: Sequence[Transaction]) -> list[Transaction]:
     raise NotImplementedError
 
+  def drain(self: Self, txns: Sequence[Transaction]) -> DrainResult:
+    """
+    Schedule repeatedly, removing each scheduled batch, until every transaction has run.
+    This generic version reruns schedule() on what remains; subclasses override it with incremental versions.
+    """
+    # Wrap once with positional ids; schedulers hand back the transactions they were given, so ids identify the batch
+    pending = [replace(txns[i], ids=frozenset({i})) for i in range(len(txns))]
+    rounds = np.full(len(pending), -1, dtype=np.int64)
+    round_num = 0
+    while pending:
+      chosen = [i for txn in self.schedule(pending) for i in txn.ids]
+      assert chosen, "Scheduler made no progress"
+      rounds[chosen] = round_num
+      pending = [txn for txn in pending if rounds[next(iter(txn.ids))] < 0]
+      round_num += 1
+    return DrainResult(rounds=rounds)
+
+def _mutable_copy(s: frozenset[int] | Set) -> set[int] | Set:
+  return set(s) if isinstance(s, frozenset) else copy.copy(s)
+
+def _compat_with(reads: set[int] | Set, writes: set[int] | Set, txn: Transaction) -> bool:
+  """
+  Same answer as Transaction(reads, writes).compat(txn), without building the merged sets
+  """
+  if isinstance(reads, set):
+    return reads.isdisjoint(txn.write_set) and writes.isdisjoint(txn.read_set) and writes.isdisjoint(txn.write_set)
+  return not bool((reads & txn.write_set) | (writes & txn.read_set) | (writes & txn.write_set))
+
 class GreedyScheduler(Scheduler):
-  def schedule(_: Self, txns: list[Transaction]) -> list[Transaction]:
-    main_txn = txns[0]
+  def schedule(_: Self, txns: Sequence[Transaction]) -> list[Transaction]:
+    if len(txns) == 0:
+      return []
+    if isinstance(txns, SignatureMatrix):
+      return [txns[i] for i in _greedy_signature_rows(txns)]
+
+    # Running read/write sets of everything scheduled so far, grown in place
+    reads = _mutable_copy(txns[0].read_set)
+    writes = _mutable_copy(txns[0].write_set)
     sched_txns = [txns[0]]
     for txn in txns[1:]:
-      if main_txn.compat(txn):
-        main_txn = main_txn.merge(txn)
+      if _compat_with(reads, writes, txn):
+        reads |= txn.read_set
+        writes |= txn.write_set
         sched_txns.append(txn)
     return sched_txns
 
+  def drain(_: Self, txns: Sequence[Transaction]) -> DrainResult:
+    """
+    Repeated greedy passes are equivalent to one first-fit pass: each transaction joins the earliest round whose
+    accumulated sets it is compatible with, exactly as the pass for that round would have admitted it.
+    """
+    if isinstance(txns, SignatureMatrix):
+      return DrainResult(rounds=_first_fit_signature_rounds(txns))
+    if isinstance(txns, Workload):
+      access_sets = ((reads.tolist(), writes.tolist()) for reads, writes in map(txns.access_sets, range(len(txns))))
+      return DrainResult(rounds=_first_fit_exact_rounds(access_sets))
+    if len(txns) > 0 and isinstance(txns[0].read_set, frozenset):
+      return DrainResult(rounds=_first_fit_exact_rounds((txn.read_set, txn.write_set) for txn in txns))
+    return DrainResult(rounds=_first_fit_set_rounds(txns))
+
+def _next_free_round(taken: dict[int, int], round_num: int) -> int:
+  """
+  Smallest round >= round_num that is not a key of taken. Each taken round points at a later candidate;
+  lookups compress the chain they walk, so repeated queries stay near O(1).
+  """
+  path = []
+  while round_num in taken:
+    path.append(round_num)
+    round_num = taken[round_num]
+  for r in path:
+    taken[r] = round_num
+  return round_num
+
+def _first_fit_exact_rounds(access_sets: Iterable[Tuple[Iterable[int], Iterable[int]]]) -> np.ndarray:
+  """
+  First-fit over exact sets. Per object we track the rounds that access it and the rounds that write it;
+  a transaction's round is the smallest one that none of its writes has accessed and none of its reads has written
+  (the mex of its excluded rounds), found by alternating next-free-round queries until they agree.
+  """
+  accessed: dict[int, dict[int, int]] = defaultdict(dict)
+  written: dict[int, dict[int, int]] = defaultdict(dict)
+  rounds = []
+  for reads, writes in access_sets:
+    constraints = [accessed[obj] for obj in writes] + [written[obj] for obj in reads]
+    round_num = 0
+    settled = False
+    while not settled:
+      settled = True
+      for taken in constraints:
+        next_round = _next_free_round(taken, round_num)
+        if next_round != round_num:
+          round_num = next_round
+          settled = False
+    for obj in reads:
+      accessed[obj].setdefault(round_num, round_num + 1)
+    for obj in writes:
+      accessed[obj].setdefault(round_num, round_num + 1)
+      written[obj].setdefault(round_num, round_num + 1)
+    rounds.append(round_num)
+  return np.array(rounds, dtype=np.int64)
+
+def _first_fit_signature_rounds(sigs: SignatureMatrix) -> np.ndarray:
+  """
+  First-fit over packed signatures, keeping one accumulated read/write row per round
+  """
+  capacity = 64
+  acc_reads = np.zeros((capacity, sigs.reads.shape[1]), dtype=np.uint64)
+  acc_writes = np.zeros_like(acc_reads)
+  num_rounds = 0
+  rounds = np.zeros(len(sigs), dtype=np.int64)
+  for i in range(len(sigs)):
+    reads, writes = sigs.reads[i], sigs.writes[i]
+    open_rounds = SignatureMatrix(reads=acc_reads[:num_rounds], writes=acc_writes[:num_rounds], family=sigs.family)
+    compatible = np.flatnonzero(~open_rounds.conflict_mask(reads, writes))
+    round_num = int(compatible[0]) if len(compatible) > 0 else num_rounds
+    if round_num == num_rounds:
+      if num_rounds == capacity:
+        capacity *= 2
+        acc_reads = np.resize(acc_reads, (capacity, acc_reads.shape[1]))
+        acc_writes = np.resize(acc_writes, (capacity, acc_writes.shape[1]))
+      acc_reads[round_num] = 0
+      acc_writes[round_num] = 0
+      num_rounds += 1
+    acc_reads[round_num] |= reads
+    acc_writes[round_num] |= writes
+    rounds[i] = round_num
+  return rounds
+
+def _first_fit_set_rounds(txns: Sequence[Transaction]) -> np.ndarray:
+  """
+  First-fit for any other Set type, keeping a mutable accumulator per round
+  """
+  acc: list[Tuple[Set, Set]] = []
+  rounds = np.zeros(len(txns), dtype=np.int64)
+  for i, txn in enumerate(txns):
+    round_num = next((r for r, (reads, writes) in enumerate(acc) if _compat_with(reads, writes, txn)), len(acc))
+    if round_num == len(acc):
+      acc.append((_mutable_copy(txn.read_set), _mutable_copy(txn.write_set)))
+    else:
+      reads, writes = acc[round_num]
+      reads |= txn.read_set
+      writes |= txn.write_set
+    rounds[i] = round_num
+  return rounds
+
+def _greedy_signature_rows(sigs: SignatureMatrix, block_size: int = 256) -> list[int]:
+  """
+  Greedy pass over packed signatures. Overlaps only grow as the accumulator does, so a row that conflicts now
+  conflicts for the rest of the pass: each block is tested at once and the scan jumps to its first compatible row.
+  """
+  reads, writes = sigs.reads[0].copy(), sigs.writes[0].copy()
+  rows = [0]
+  start = 1
+  while start < len(sigs):
+    block = sigs[start:start + block_size]
+    compatible = np.flatnonzero(~block.conflict_mask(reads, writes))
+    if len(compatible) == 0:
+      start += len(block)
+      continue
+    row = start + compatible[0]
+    reads |= sigs.reads[row]
+    writes |= sigs.writes[row]
+    rows.append(int(row))
+    start = row + 1
+  return rows
+
+def _tournament_signature_rows(sigs: SignatureMatrix, arity: int) -> np.ndarray:
+  """
+  Tournament over packed signatures: each level is arity - 1 vectorized compat-and-merge steps across all brackets.
+  Levels are padded to a multiple of arity with empty signatures, which are compatible with everything and so act as byes;
+  owner[i] is the node currently holding row i, or -1 once the row has been knocked out.
+  """
+  width = sigs.reads.shape[1]
+  reads, writes = sigs.reads, sigs.writes
+  owner = np.arange(len(sigs))
+  while len(reads) > 1:
+    num_brackets = -(-len(reads) // arity)
+    padding = np.zeros((num_brackets * arity - len(reads), width), dtype=np.uint64)
+    reads = np.concatenate([reads, padding]).reshape(num_brackets, arity, width)
+    writes = np.concatenate([writes, padding]).reshape(num_brackets, arity, width)
+    acc_reads, acc_writes = reads[:, 0].copy(), writes[:, 0].copy()
+    won = np.ones((num_brackets, arity), dtype=bool)
+    for slot in range(1, arity):
+      challengers = SignatureMatrix(reads=reads[:, slot], writes=writes[:, slot], family=sigs.family)
+      merged = ~challengers.conflict_mask(acc_reads, acc_writes)
+      acc_reads[merged] |= challengers.reads[merged]
+      acc_writes[merged] |= challengers.writes[merged]
+      won[:, slot] = merged
+    alive = owner >= 0
+    owner[alive] = np.where(won.ravel()[owner[alive]], owner[alive] // arity, -1)
+    reads, writes = acc_reads, acc_writes
+  return np.flatnonzero(owner == 0)
+
 class TournamentScheduler(Scheduler):
-  def schedule(_: Self, all_txns: list[Transaction]) -> list[Transaction]:
-    txns = copy.copy(all_txns)
+  arity: int
+
+  def __init__(self, arity: int = 2):
+    assert arity >= 2, "Tournament brackets need at least two entrants"
+    self.arity = arity
+
+  def depth(self: Self, num_txns: int) -> int:
+    """
+    Number of levels needed to reduce num_txns entrants to a single winner
+    """
+    levels = 0
+    while num_txns > 1:
+      num_txns = -(-num_txns // self.arity)
+      levels += 1
+    return levels
+
+  def schedule(self: Self, all_txns: Sequence[Transaction]) -> list[Transaction]:
+    if len(all_txns) == 0:
+      return []
+    if isinstance(all_txns, SignatureMatrix):
+      return [all_txns[int(i)] for i in _tournament_signature_rows(all_txns, self.arity)]
+
+    # Ids can be global (a workload slice keeps its offset), so number entrants by position to map winners back
+    txns = [replace(all_txns[i], ids=frozenset({i})) for i in range(len(all_txns))]
     while len(txns) > 1:
-      assert len(txns) % 2 == 0
       new_txns = []
-      for (ts1, ts2) in itertools.batched(txns, 2):
-        new_txn = ts1.merge(ts2) if ts1.compat(ts2) else ts1
-        new_txns.append(new_txn)
+      for bracket in itertools.batched(txns, self.arity):
+        # A short final bracket just has fewer challengers; a lone entrant gets a bye to the next level
+        winner = bracket[0]
+        for txn in bracket[1:]:
+          if winner.compat(txn):
+            winner = winner.merge(txn)
+        new_txns.append(winner)
       txns = new_txns
-    return [all_txns[id] for id in txns[0].ids]
+    return [all_txns[i] for i in sorted(txns[0].ids)]
+
+  def drain(self: Self, txns: Sequence[Transaction]) -> DrainResult:
+    if not isinstance(txns, SignatureMatrix):
+      return super().drain(txns)
+    rounds = np.full(len(txns), -1, dtype=np.int64)
+    pending = np.arange(len(txns))
+    round_num = 0
+    while len(pending) > 0:
+      remaining = SignatureMatrix(reads=txns.reads[pending], writes=txns.writes[pending], family=txns.family)
+      chosen = _tournament_signature_rows(remaining, self.arity)
+      rounds[pending[chosen]] = round_num
+      pending = np.delete(pending, chosen)
+      round_num += 1
+    return DrainResult(rounds=rounds)
 
 class CompressedScheduler(Scheduler):
   underlying: Scheduler
@@ -40,13 +306,326 @@ class CompressedScheduler(Scheduler):
     self.underlying = underlying
     self.family = family
 
-  def schedule(self: Self, all_txns: list[Transaction]) -> list[Transaction]:
+  def schedule(self: Self, all_txns: Sequence[Transaction]) -> list[Transaction]:
     txns = compress_workload(all_txns, self.family)
     return self.underlying.schedule(txns)
 
+  def drain(self: Self, all_txns: Sequence[Transaction]) -> DrainResult:
+    txns = compress_workload(all_txns, self.family)
+    return self.underlying.drain(txns)
+
+@dataclass(frozen=True)
+class ShardStats:
+  """
+  How one ShardedScheduler batch split across shards
+  """
+  routed: np.ndarray     # single-shard transactions routed to each shard
+  scheduled: np.ndarray  # scheduled transactions touching each shard, single- or cross-shard
+  num_txns: int
+  num_cross_shard: int
+  cross_shard_admitted: int
+
+  @property
+  def cross_shard_fraction(self) -> float:
+    return self.num_cross_shard / self.num_txns if self.num_txns > 0 else 0.0
+
+  @property
+  def utilization(self) -> np.ndarray:
+    """
+    Scheduled load of each shard relative to the busiest one, which bounds how fast the batch runs
+    """
+    return self.scheduled / self.scheduled.max() if self.scheduled.max() > 0 else np.zeros(len(self.scheduled))
+
+def _schedule_shard(underlying: Scheduler, txns: list[Transaction]) -> list[int]:
+  """
+  Positions (in txns) of the transactions one shard schedules; ids are positions, as in Scheduler.drain
+  """
+  return sorted(k for txn in underlying.schedule(txns) for k in txn.ids)
+
+class ShardedScheduler(Scheduler):
+  """
+  Objects are hash-partitioned across num_shards independent schedulers. Transactions whose objects all live on one shard
+  take the fast path: each shard runs the underlying scheduler on its own transactions, in parallel worker processes.
+  Cross-shard transactions are then admitted in order by two-phase admission: every shard they touch checks their
+  projection onto its objects against what it has admitted (prepare), and only if all agree is it added everywhere (commit).
+  Use it as a context manager to keep one worker pool across calls; otherwise each call starts its own.
+  Inputs must hold exact (frozenset) sets so they can be projected; the underlying scheduler may compress them itself.
+  """
+  underlying: Scheduler
+  num_shards: int
+  num_workers: int | None
+  router: Callable[[int], int]
+  executor: ProcessPoolExecutor | None
+
+  def __init__(self, underlying: Scheduler, num_shards: int, num_workers: int | None = None, seed: int = 0):
+    assert num_shards > 0
+    self.underlying = underlying
+    self.num_shards = num_shards
+    self.num_workers = num_workers
+    self.router = make_hash_function(num_shards, random.Random(seed))
+    self.executor = None
+
+  def __enter__(self) -> Self:
+    if self.num_workers != 1:
+      self.executor = ProcessPoolExecutor(max_workers=self.num_workers)
+    return self
+
+  def __exit__(self, *_):
+    if self.executor is not None:
+      self.executor.shutdown()
+      self.executor = None
+
+  def _map_shards(self: Self, shard_txns: list[list[Transaction]]) -> list[list[int]]:
+    underlying = [self.underlying] * len(shard_txns)
+    if self.executor is not None:
+      return list(self.executor.map(_schedule_shard, underlying, shard_txns))
+    if self.num_workers == 1:
+      return list(map(_schedule_shard, underlying, shard_txns))
+    with ProcessPoolExecutor(max_workers=self.num_workers) as exec:
+      return list(exec.map(_schedule_shard, underlying, shard_txns))
+
+  def schedule(self: Self, txns: Sequence[Transaction]) -> list[Transaction]:
+    return self.schedule_with_stats(txns)[0]
+
+  def schedule_with_stats(self: Self, txns: Sequence[Transaction]) -> Tuple[list[Transaction], ShardStats]:
+    txns = [txns[i] for i in range(len(txns))]
+    assert all(isinstance(txn.read_set, frozenset) for txn in txns), "ShardedScheduler routes exact sets"
+    objs = sorted({obj for txn in txns for obj in txn.read_set | txn.write_set})
+    shard_of = dict(zip(objs, self.router.hash_many(np.array(objs, dtype=np.int64)).tolist()))
+
+    # Route: one list of (position, txn) per shard for the fast path, the rest are cross-shard
+    local: list[list[int]] = [[] for _ in range(self.num_shards)]
+    cross = []
+    for i, txn in enumerate(txns):
+      shards = {shard_of[obj] for obj in txn.read_set | txn.write_set}
+      if len(shards) > 1:
+        cross.append(i)
+      else:
+        # A transaction with no objects conflicts with nothing; any shard will do
+        local[shards.pop() if shards else i % self.num_shards].append(i)
+
+    shard_txns = [[replace(txns[i], ids=frozenset({k})) for k, i in enumerate(routed)] for routed in local]
+    chosen = [[local[s][k] for k in ks] for s, ks in enumerate(self._map_shards(shard_txns))]
+
+    # Each shard's admitted reads and writes, which only ever contain its own objects
+    reads: list[set[int]] = [set() for _ in range(self.num_shards)]
+    writes: list[set[int]] = [set() for _ in range(self.num_shards)]
+    scheduled = np.zeros(self.num_shards, dtype=np.int64)
+    for s, positions in enumerate(chosen):
+      for i in positions:
+        reads[s] |= txns[i].read_set
+        writes[s] |= txns[i].write_set
+      scheduled[s] += len(positions)
+
+    admitted = []
+    for i in cross:
+      txn = txns[i]
+      parts = defaultdict(lambda: (set(), set()))
+      for obj in txn.read_set:
+        parts[shard_of[obj]][0].add(obj)
+      for obj in txn.write_set:
+        parts[shard_of[obj]][1].add(obj)
+      # Prepare: every participant votes on its projection; commit only on a unanimous yes
+      if all(r.isdisjoint(writes[s]) and w.isdisjoint(reads[s]) and w.isdisjoint(writes[s]) for s, (r, w) in parts.items()):
+        for s, (r, w) in parts.items():
+          reads[s] |= r
+          writes[s] |= w
+          scheduled[s] += 1
+        admitted.append(i)
+
+    stats = ShardStats(routed=np.array([len(routed) for routed in local], dtype=np.int64), scheduled=scheduled,
+                       num_txns=len(txns), num_cross_shard=len(cross), cross_shard_admitted=len(admitted))
+    positions = sorted(itertools.chain(admitted, *chosen))
+    return [txns[i] for i in positions], stats
+
+class RunningSet(ABC):
+  """
+  Read/write sets of the transactions currently running, which must support retiring a transaction.
+  Schedulers build one by calling a factory with the most transactions that can be live at once.
+  """
+  def conflicts(self: Self, txn: Transaction) -> bool:
+    raise NotImplementedError
+
+  def add(self: Self, txn: Transaction):
+    raise NotImplementedError
+
+  def remove(self: Self, txn: Transaction):
+    raise NotImplementedError
+
+class ExactRunningSet(RunningSet):
+  """
+  Per-object reader and writer counts over exact (frozenset) transactions
+  """
+  readers: Counter
+  writers: Counter
+
+  def __init__(self, max_in_flight: int | None = None):
+    self.readers = Counter()
+    self.writers = Counter()
+
+  def conflicts(self: Self, txn: Transaction) -> bool:
+    return any(self.writers[obj] for obj in txn.read_set) or \
+           any(self.readers[obj] or self.writers[obj] for obj in txn.write_set)
+
+  def add(self: Self, txn: Transaction):
+    self.readers.update(txn.read_set)
+    self.writers.update(txn.write_set)
+
+  def remove(self: Self, txn: Transaction):
+    # Drop objects nobody holds any more, so the counters only cover live transactions
+    for counts, objs in [(self.readers, txn.read_set), (self.writers, txn.write_set)]:
+      for obj in objs:
+        counts[obj] -= 1
+        if counts[obj] == 0:
+          del counts[obj]
+
+class CountingRunningSet(RunningSet):
+  """
+  Counting Bloom filters over ParallelBloomFilter-compressed transactions built with the same hash functions.
+  A conflict test reads only the counters at the transaction's signature bits, and agrees with Transaction.compat on the
+  merged sets. Counters are widened so max_in_flight transactions cannot saturate them; as a backstop, both filters are
+  cleared whenever the last live transaction retires.
+  """
+  reads: CountingBloomFilter
+  writes: CountingBloomFilter
+  num_live: int
+
+  def __init__(self, family: CountingBloomFilterFamily, max_in_flight: int | None = None):
+    if max_in_flight is not None:
+      family = replace(family, counter_bits=max(family.counter_bits, counter_bits_for(max_in_flight)))
+    self.reads = family()
+    self.writes = family()
+    self.num_live = 0
+
+  def conflicts(self: Self, txn: Transaction) -> bool:
+    # (reads & w) | (writes & r) | (writes & w), non-empty only if the overlapping bits cover every partition
+    hits = np.concatenate([self.reads.overlap(txn.write_set), self.writes.overlap(txn.read_set),
+                           self.writes.overlap(txn.write_set)])
+    return self.reads.covers_all_parts(hits)
+
+  def add(self: Self, txn: Transaction):
+    self.reads.add_signature(txn.read_set)
+    self.writes.add_signature(txn.write_set)
+    self.num_live += 1
+
+  def remove(self: Self, txn: Transaction):
+    self.num_live -= 1
+    if self.num_live == 0:
+      self.reads.clear()
+      self.writes.clear()
+      return
+    self.reads.remove_signature(txn.read_set)
+    self.writes.remove_signature(txn.write_set)
+
+@dataclass(frozen=True)
+class StreamStep:
+  """
+  What happened in one step of a StreamingScheduler run
+  """
+  step: int
+  admitted: int  # lookahead entries scheduled onto a puppet
+  blocked: int   # lookahead entries that conflicted with the running set and were re-inserted
+  stalled: int   # lookahead entries not checked because every puppet's active list was full
+  retired: int   # transactions whose work finished at the start of this step
+  active: int    # transactions running after this step
+  buffered: int  # transactions waiting in the input and lookahead buffers after this step
+
+class StreamingScheduler:
+  """
+  Sliding-window model of the hardware scheduler in new-pmhw/src/Puppetmaster.bsv. Transactions flow from an unbounded
+  stream into a bounded input buffer, then a lookahead buffer whose entries are checked against the running set each step.
+  A compatible entry goes to the next puppet (round robin) with room in its active list; a conflicting one is re-inserted.
+  Each puppet finishes its active transactions in order, work_steps apart, and retiring one removes it from the running set.
+  The running set supports removal directly, so the hardware's shadow-summary refresh is not modelled.
+  """
+  input_buffer_size: int
+  lookahead_size: int
+  num_puppets: int
+  active_per_puppet: int
+  work_steps: int
+  running_set: Callable[[int], RunningSet]
+
+  # Defaults follow Puppetmaster.bsv, where ActivePerPuppet is 7 (a power of two minus one). The software scheduler
+  # agrees: its MAX_ACTIVE_PER_PUPPET=8 ring buffer (wrapper/include/st_queue.h) keeps one slot empty, so it also holds 7
+  def __init__(self, input_buffer_size: int = 56, lookahead_size: int = 2, num_puppets: int = 8,
+               active_per_puppet: int = 7, work_steps: int = 1, running_set: Callable[[int], RunningSet] = ExactRunningSet):
+    assert input_buffer_size >= 0 and lookahead_size > 0 and num_puppets > 0 and active_per_puppet > 0 and work_steps > 0
+    self.input_buffer_size = input_buffer_size
+    self.lookahead_size = lookahead_size
+    self.num_puppets = num_puppets
+    self.active_per_puppet = active_per_puppet
+    self.work_steps = work_steps
+    self.running_set = running_set
+
+  @property
+  def max_in_flight(self) -> int:
+    """
+    Bound on live transactions that the running set is sized for: each puppet holds at most active_per_puppet
+    """
+    return self.num_puppets * self.active_per_puppet
+
+  def run(self: Self, txns: Iterable[Transaction]) -> Iterator[StreamStep]:
+    """
+    Consume txns lazily, yielding one StreamStep per step until the stream is exhausted and everything has retired
+    """
+    stream = iter(txns)
+    exhausted = False
+    input_buffer: deque[Transaction] = deque()
+    lookahead: deque[Transaction] = deque()
+    puppets: list[deque[Tuple[Transaction, int]]] = [deque() for _ in range(self.num_puppets)]
+    running = self.running_set(self.max_in_flight)
+    next_puppet = 0
+    num_active = 0
+    step = 0
+    while True:
+      retired = 0
+      for puppet in puppets:
+        while puppet and puppet[0][1] <= step:
+          txn, _ = puppet.popleft()
+          running.remove(txn)
+          retired += 1
+      num_active -= retired
+
+      while not exhausted and len(input_buffer) + len(lookahead) < self.input_buffer_size + self.lookahead_size:
+        txn = next(stream, None)
+        if txn is None:
+          exhausted = True
+        else:
+          input_buffer.append(txn)
+      while input_buffer and len(lookahead) < self.lookahead_size:
+        lookahead.append(input_buffer.popleft())
+
+      if exhausted and not input_buffer and not lookahead and num_active == 0 and retired == 0:
+        return
+
+      admitted = blocked = stalled = 0
+      for _ in range(len(lookahead)):
+        free = next((p % self.num_puppets for p in range(next_puppet, next_puppet + self.num_puppets)
+                     if len(puppets[p % self.num_puppets]) < self.active_per_puppet), None)
+        if free is None:
+          stalled = len(lookahead) - admitted - blocked
+          break
+        txn = lookahead.popleft()
+        if running.conflicts(txn):
+          lookahead.append(txn)
+          blocked += 1
+          continue
+        running.add(txn)
+        puppet = puppets[free]
+        start = max(step, puppet[-1][1]) if puppet else step
+        puppet.append((txn, start + self.work_steps))
+        next_puppet = free + 1
+        admitted += 1
+      num_active += admitted
+      assert num_active > 0 or blocked == 0, "An empty running set cannot conflict"
+
+      yield StreamStep(step=step, admitted=admitted, blocked=blocked, stalled=stalled, retired=retired,
+                       active=num_active, buffered=len(input_buffer) + len(lookahead))
+      step += 1
+
 if __name__ == "__main__":
   addr_space = list(range(2**24))
-  workload = list(make_workload(addr_space, 256, 16, 0.0, 0.5))
+  workload = make_workload(addr_space, 256, 16, 0.0, 0.5)
   family = make_parallel_bloom_filter_family(1024, 4)
 
   greedy = GreedyScheduler()
@@ -58,5 +637,42 @@ if __name__ == "__main__":
   tournament = TournamentScheduler()
   print(len(tournament.schedule(workload)))
 
+  # A slice keeps its global ids; the tournament must still return the slice's own winners
+  whole = make_workload(2**10, 512, 8, 0.9, 0.5)
+  window = whole[200:300]
+  local = [replace(whole[i], ids=frozenset({i - 200})) for i in range(200, 300)]
+  expected = [200 + min(txn.ids) for txn in tournament.schedule(local)]
+  assert [min(txn.ids) for txn in tournament.schedule(window)] == expected
+
+  # Signature and scalar brackets agree on an offset, odd-sized window of any arity (the odd entrant gets a bye)
+  signatures = compress_workload(whole, family)[201:300]
+  for arity in [2, 3, 4]:
+    tournament_k = TournamentScheduler(arity)
+    assert [txn.ids for txn in tournament_k.schedule(signatures)] == [txn.ids for txn in tournament_k.schedule(list(signatures))]
+
   tournament_c = CompressedScheduler(tournament, family)
   print(len(tournament_c.schedule(workload)))
+
+  for s in [greedy, greedy_c, tournament, tournament_c]:
+    result = s.drain(workload)
+    print(f"{result.num_rounds} rounds, parallelism {result.parallelism:.2f}")
+
+  # Bracket arity trades tree depth against comparator width on a full 2^16-entry window
+  window = compress_workload(make_workload(2**24, 2**16, 16, 0.0, 0.5), family)
+  for arity in [2, 4, 8, 16]:
+    tournament_k = TournamentScheduler(arity)
+    print(f"arity {arity}: depth {tournament_k.depth(len(window))}, {len(tournament_k.schedule(window))} scheduled")
+
+  # Throughput as objects are split across more scheduler instances
+  for num_shards in [1, 2, 4, 8]:
+    with ShardedScheduler(greedy, num_shards) as sharded:
+      sched_txns, stats = sharded.schedule_with_stats(workload)
+      result = sharded.drain(workload)
+    print(f"{num_shards} shards: {len(sched_txns)} scheduled, {stats.cross_shard_fraction:.2f} cross-shard, "
+          f"utilization {np.round(stats.utilization, 2)}, drain parallelism {result.parallelism:.2f}")
+
+  # Streaming admission with the hardware's buffer sizes
+  steps = list(StreamingScheduler(work_steps=8).run(make_workload(2**24, 10_000, 16, 0.8, 0.5)))
+  admitted = sum(s.admitted for s in steps)
+  print(f"streamed {admitted} txns in {len(steps)} steps ({admitted / len(steps):.2f} per step), "
+        f"{sum(s.blocked for s in steps)} blocked checks, {sum(s.stalled for s in steps)} stalled")
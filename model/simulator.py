@@ -0,0 +1,267 @@
+from typing import *
+from workload import Transaction, make_workload
+from scheduler import RunningSet, ExactRunningSet
+from dataclasses import dataclass
+from collections import deque
+import heapq
+import struct
+import numpy as np
+
+# Queue sizes in wrapper/include/pmhw.h. The queues are ring buffers (wrapper/include/st_queue.h, spsc_queue.h) that
+# report full when (tail + 1) & mask == head, so a queue of size n holds n - 1 entries.
+MAX_PENDING_PER_CLIENT = 64
+MAX_ACTIVE_PER_PUPPET = 8
+
+def _ring_capacity(size: int) -> int:
+  return size - 1
+
+# Analysis settings in runner/src/analyze.c
+NUM_THROUGHPUT_WINDOWS = 30
+NUM_HISTOGRAM_BUCKETS = 64
+
+STAGES = ["submit", "sched", "recv", "done", "cleanup"]
+LATENCIES = {
+  "e2e": ("submit", "done"),
+  "submit_sched": ("submit", "sched"),
+  "sched_recv": ("sched", "recv"),
+  "recv_done": ("recv", "done"),
+  "done_cleanup": ("done", "cleanup"),
+}
+
+_SUBMIT, _SCHED, _DONE = range(3)
+
+@dataclass(frozen=True)
+class Timeline:
+  """
+  Per-transaction timestamps (in microseconds) of the stages logged by the runner, and the puppet each ran on
+  """
+  submit: np.ndarray
+  sched: np.ndarray
+  recv: np.ndarray
+  done: np.ndarray
+  cleanup: np.ndarray
+  puppet: np.ndarray
+
+  def __len__(self) -> int:
+    return len(self.submit)
+
+  def stage(self, name: str) -> np.ndarray:
+    return getattr(self, name)
+
+class PuppetmasterSimulator:
+  """
+  Discrete-event model of runner/src/main.c driving the software scheduler in wrapper/src/pmhw_sim.c.
+  Clients submit in order into bounded pending queues, blocking while theirs is full. The scheduler admits the head of
+  a pending queue when it does not conflict with the running set and the current puppet (round robin) has room in its
+  active list; each decision takes sched_latency_us. Queue sizes are given as in pmhw.h, and like the C ring buffers a
+  queue of size n holds n - 1 transactions (63 pending per client, 7 active per puppet by default). Puppets run their
+  transactions in order for work_us each and report done; the scheduler cleans a transaction up (freeing its active
+  slot and running-set entry) the next time it is idle.
+  """
+  num_clients: int
+  num_puppets: int
+  work_us: float | np.ndarray
+  sched_latency_us: float
+  client_gap_us: float
+  max_pending_per_client: int
+  max_active_per_puppet: int
+  running_set: Callable[[int], RunningSet]
+
+  def __init__(self, num_clients: int = 1, num_puppets: int = 8, work_us: float | np.ndarray = 0.0,
+               sched_latency_us: float = 0.1, client_gap_us: float = 0.0,
+               max_pending_per_client: int = MAX_PENDING_PER_CLIENT, max_active_per_puppet: int = MAX_ACTIVE_PER_PUPPET,
+               running_set: Callable[[int], RunningSet] = ExactRunningSet):
+    assert num_clients > 0 and num_puppets > 0 and max_pending_per_client > 1 and max_active_per_puppet > 1
+    assert sched_latency_us >= 0 and client_gap_us >= 0
+    self.num_clients = num_clients
+    self.num_puppets = num_puppets
+    self.work_us = work_us
+    self.sched_latency_us = sched_latency_us
+    self.client_gap_us = client_gap_us
+    self.max_pending_per_client = max_pending_per_client
+    self.max_active_per_puppet = max_active_per_puppet
+    self.running_set = running_set
+
+  def run(self: Self, txns: Sequence[Transaction]) -> Timeline:
+    """
+    Simulate until every transaction has been cleaned up. Client c submits transactions c, c + num_clients, ...
+    work_us is either one service time for all transactions or an array with one per transaction.
+    """
+    n = len(txns)
+    work = np.broadcast_to(np.asarray(self.work_us, dtype=np.float64), (n,))
+    times = {stage: np.full(n, np.nan) for stage in STAGES}
+    puppet_of = np.full(n, -1, dtype=np.int64)
+
+    events: list[Tuple[float, int, int, Any]] = []
+    seq = 0
+    def push(time: float, kind: int, arg: Any):
+      nonlocal seq
+      heapq.heappush(events, (time, seq, kind, arg))
+      seq += 1
+
+    pending: list[deque[Tuple[int, Transaction]]] = [deque() for _ in range(self.num_clients)]
+    blocked: list[int | None] = [None] * self.num_clients
+    active: list[deque[int]] = [deque() for _ in range(self.num_puppets)]
+    done_qs: list[deque[int]] = [deque() for _ in range(self.num_puppets)]
+    active_txns: dict[int, Transaction] = {}
+    puppet_free_at = [0.0] * self.num_puppets
+    pending_capacity = _ring_capacity(self.max_pending_per_client)
+    active_capacity = _ring_capacity(self.max_active_per_puppet)
+    running = self.running_set(self.num_puppets * active_capacity)
+    scheduler_busy = False
+    current_puppet = 0
+    current_client = 0
+
+    def enqueue(client: int, i: int, now: float):
+      pending[client].append((i, txns[i]))
+      if i + self.num_clients < n:
+        push(now + self.client_gap_us, _SUBMIT, i + self.num_clients)
+
+    def wake_scheduler(now: float):
+      nonlocal scheduler_busy, current_puppet, current_client
+      if scheduler_busy:
+        return
+      for p in range(self.num_puppets):
+        while done_qs[p]:
+          i = done_qs[p].popleft()
+          assert active[p].popleft() == i, "Puppets must finish their transactions in order"
+          running.remove(active_txns.pop(i))
+          times["cleanup"][i] = now
+      if len(active[current_puppet]) == active_capacity:
+        return
+      for c in range(current_client, current_client + self.num_clients):
+        client = c % self.num_clients
+        if not pending[client] or running.conflicts(pending[client][0][1]):
+          continue
+        i, txn = pending[client].popleft()
+        if blocked[client] is not None:
+          enqueue(client, blocked[client], now)
+          blocked[client] = None
+        running.add(txn)
+        active_txns[i] = txn
+        active[current_puppet].append(i)
+        puppet_of[i] = current_puppet
+        push(now + self.sched_latency_us, _SCHED, i)
+        scheduler_busy = True
+        current_client = client
+        current_puppet = (current_puppet + 1) % self.num_puppets
+        return
+
+    for client in range(min(self.num_clients, n)):
+      push(0.0, _SUBMIT, client)
+
+    while events:
+      now, _, kind, i = heapq.heappop(events)
+      if kind == _SUBMIT:
+        client = i % self.num_clients
+        times["submit"][i] = now
+        if len(pending[client]) < pending_capacity:
+          enqueue(client, i, now)
+        else:
+          blocked[client] = i
+      elif kind == _SCHED:
+        p = puppet_of[i]
+        times["sched"][i] = now
+        recv = max(now, puppet_free_at[p])
+        puppet_free_at[p] = recv + work[i]
+        times["recv"][i] = recv
+        push(puppet_free_at[p], _DONE, i)
+        scheduler_busy = False
+      else:
+        times["done"][i] = now
+        done_qs[puppet_of[i]].append(i)
+      wake_scheduler(now)
+
+    if np.isnan(times["cleanup"]).any():
+      raise Exception("Simulation stalled: some transactions were never scheduled (saturated running set?)")
+    return Timeline(**times, puppet=puppet_of)
+
+@dataclass(frozen=True)
+class Histogram:
+  centers: np.ndarray  # seconds
+  counts: np.ndarray
+  cdf: np.ndarray
+  unit: int  # time_unit_t in analyze.c: 0 ns, 1 us, 2 ms, 3 s
+
+@dataclass(frozen=True)
+class StageMetrics:
+  """
+  The quantities runner/src/analyze.c derives from a log, in seconds and transactions per second
+  """
+  num_txns: int
+  duration: float
+  window: float
+  window_times: np.ndarray
+  throughput: dict[str, np.ndarray]  # per stage, one value per window
+  average_throughput: float
+  latencies: dict[str, np.ndarray]   # per latency type, sorted
+  histograms: dict[str, Histogram]
+
+  def summary(self) -> str:
+    e2e = self.latencies["e2e"]
+    return (f"{self.num_txns} txns in {self.duration:.6f} s: {self.average_throughput:.2f} txn/s, "
+            f"e2e latency p50 {np.quantile(e2e, 0.5) * 1e6:.2f} us, p99 {np.quantile(e2e, 0.99) * 1e6:.2f} us")
+
+def _time_unit(seconds: float) -> int:
+  return 0 if seconds < 1e-6 else 1 if seconds < 1e-3 else 2 if seconds < 1.0 else 3
+
+def _histogram(latencies: np.ndarray, num_buckets: int) -> Histogram:
+  lo, hi = float(latencies[0]), float(latencies[-1])
+  width = (hi - lo) / num_buckets
+  centers = lo + width * (np.arange(num_buckets) + 0.5)
+  buckets = np.zeros(len(latencies), dtype=np.int64) if width == 0 else ((latencies - lo) / width).astype(np.int64)
+  counts = np.bincount(np.clip(buckets, 0, num_buckets - 1), minlength=num_buckets)
+  return Histogram(centers=centers, counts=counts, cdf=np.cumsum(counts) / len(latencies), unit=_time_unit((lo + hi) / 2))
+
+def analyze_timeline(timeline: Timeline, num_windows: int = NUM_THROUGHPUT_WINDOWS,
+                     num_buckets: int = NUM_HISTOGRAM_BUCKETS) -> StageMetrics:
+  """
+  Windowed per-stage throughput over [first submit, last done] and per-stage latency distributions, as in analyze.c
+  (which keeps every transaction: its warmup/cooldown fractions and outlier cutoffs are all zero)
+  """
+  assert len(timeline) > 0
+  stages = {stage: timeline.stage(stage) * 1e-6 for stage in STAGES}
+  first_submit = stages["submit"].min()
+  duration = stages["done"].max() - first_submit
+  window = duration / num_windows
+
+  throughput = {}
+  for stage, ts in stages.items():
+    idx = np.floor((ts - first_submit) / window).astype(np.int64) if window > 0 else np.zeros(len(ts), dtype=np.int64)
+    idx = idx[(idx >= 0) & (idx < num_windows)]
+    throughput[stage] = np.bincount(idx, minlength=num_windows) / window if window > 0 else np.zeros(num_windows)
+
+  latencies = {name: np.sort(stages[end] - stages[start]) for name, (start, end) in LATENCIES.items()}
+  return StageMetrics(num_txns=len(timeline), duration=duration, window=window,
+                      window_times=(np.arange(num_windows) + 0.5) * window, throughput=throughput,
+                      average_throughput=len(timeline) / duration if duration > 0 else float("inf"),
+                      latencies=latencies,
+                      histograms={name: _histogram(lat, num_buckets) for name, lat in latencies.items()})
+
+def write_analyzed_bin(metrics: StageMetrics, filename: str, num_puppets: int):
+  """
+  Write metrics in the analyzed.bin layout produced by analyze.c, so runner/scripts/visualize.py can plot them.
+  Simulated timestamps are microseconds, so the recorded clock frequency is 1 MHz.
+  """
+  num_windows = len(metrics.window_times)
+  num_buckets = len(metrics.histograms["e2e"].counts)
+  with open(filename, "wb") as f:
+    f.write(struct.pack("=iiiididid", metrics.num_txns, metrics.num_txns, metrics.num_txns, num_buckets, 1e6,
+                        num_puppets, metrics.average_throughput, num_windows, metrics.window))
+    for stage in STAGES:
+      for x, y in zip(metrics.window_times, metrics.throughput[stage]):
+        f.write(struct.pack("=dd", x, y))
+    for name in LATENCIES:
+      f.write(struct.pack("=i", metrics.histograms[name].unit))
+    for name in LATENCIES:
+      hist = metrics.histograms[name]
+      for center, count, cdf in zip(hist.centers, hist.counts, hist.cdf):
+        f.write(struct.pack("=did", center, count, cdf))
+
+if __name__ == "__main__":
+  workload = make_workload(2**20, 100_000, 16, 0.8, 0.5)
+  for num_puppets in [4, 8, 16]:
+    for work_us in [0.0, 1.0, 10.0]:
+      sim = PuppetmasterSimulator(num_puppets=num_puppets, work_us=work_us)
+      metrics = analyze_timeline(sim.run(workload))
+      print(f"{num_puppets} puppets, {work_us} us work: {metrics.summary()}")
@@ -1,15 +1,21 @@
 from typing import *
-from dataclasses import dataclass
-from bloom_filter import Set, make_parallel_bloom_filter_family
+from dataclasses import dataclass, replace
+from bloom_filter import Set, ParallelBloomFilter, ParallelBloomFilterFamily, make_parallel_bloom_filter_family, hash_family_many
 import itertools
-import random
 import numpy as np
 import matplotlib.pyplot as plt
 from tqdm import tqdm
 import os
+import sys
+import threading
 import csv
 import struct
-from multiprocessing import Pool, cpu_count
+import atexit
+import math
+from collections import OrderedDict
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from concurrent.futures import ProcessPoolExecutor
 
 @dataclass(frozen=True)
 class Transaction:
@@ -32,38 +38,408 @@ class Transaction:
       write_set = ts1.write_set | ts2.write_set
     )
 
-def make_zipf_weights(n: int, alpha: float, cache={}) -> np.array:
-  key = (n, alpha)
-  if key not in cache:
-    cache[key] = 1.0 / (np.arange(n) + 1)**alpha
-  return cache[key]
+ZipfKind = Literal["weights", "cdf"]
+ZipfKey = Tuple[ZipfKind, int, float]
 
-def _build_single_txn(args):
-  txn_id, objs, writes = args
-  write_set = frozenset(obj for obj, write in zip(objs, writes) if write)
-  read_set = frozenset(obj for obj, write in zip(objs, writes) if not write)
-  return Transaction(ids=frozenset({txn_id}), read_set=read_set, write_set=write_set)
+@dataclass(frozen=True)
+class SharedZipfHandle:
+  """
+  Picklable reference to a cached Zipf array living in shared memory
+  """
+  key: ZipfKey
+  shm_name: str
+  length: int
+
+def _compute_zipf_array(kind: ZipfKind, n: int, theta: float) -> np.ndarray:
+  weights = 1.0 / (np.arange(n) + 1)**theta
+  if kind == "weights":
+    return weights
+  cdf = np.cumsum(weights, out=weights)
+  cdf /= cdf[-1]
+  return cdf
+
+_UNTRACKED_ATTACH_LOCK = threading.Lock()
+
+def attach_untracked(name: str) -> SharedMemory:
+  """
+  Attach to a segment some other process owns without registering it with our resource tracker. Pool workers share
+  the owner's tracker, so registering (or unregistering afterwards) would clash with the owner's unlink.
+  Before Python 3.13 (no track=False) this swaps out resource_tracker.register for the whole process while attaching.
+  The lock serializes callers of this function only: a segment another thread creates during the swap is not tracked.
+  """
+  if sys.version_info >= (3, 13):
+    return SharedMemory(name=name, track=False)
+  with _UNTRACKED_ATTACH_LOCK:
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None if rtype == "shared_memory" else register(name, rtype)
+    try:
+      return SharedMemory(name=name)
+    finally:
+      resource_tracker.register = register
+
+class SharedZipfCache:
+  """
+  Size-bounded LRU cache of Zipf weight and CDF arrays, keyed by (kind, n, theta).
+  In the process that created the cache, arrays live in shared memory so pool workers can attach them zero-copy
+  through handles(); other processes (e.g. forked workers) keep misses in private memory and never unlink segments.
+  Cached arrays are read-only.
+  """
+  def __init__(self, max_bytes: int = 2**30):
+    self.max_bytes = max_bytes
+    self.owner_pid = os.getpid()
+    self.entries: OrderedDict[ZipfKey, Tuple[np.ndarray, SharedMemory | None]] = OrderedDict()
+    self.attached: dict[ZipfKey, Tuple[np.ndarray, SharedMemory]] = {}
+    self.retired: list[SharedMemory] = []  # segments whose close() failed because views were still alive
+    self.nbytes = 0
+
+  def get(self, kind: ZipfKind, n: int, theta: float) -> np.ndarray:
+    key = (kind, n, float(theta))
+    if key in self.attached:
+      return self.attached[key][0]
+    if key in self.entries:
+      self.entries.move_to_end(key)
+      return self.entries[key][0]
+
+    values = _compute_zipf_array(kind, n, key[2])
+    shm = None
+    if os.getpid() == self.owner_pid:
+      shm = SharedMemory(create=True, size=max(values.nbytes, 1))
+      # frombuffer (unlike np.ndarray(buffer=...)) pins the buffer, so close() fails while views are alive
+      array = np.frombuffer(shm.buf, dtype=np.float64, count=len(values))
+      array[:] = values
+      values = array
+    values.flags.writeable = False
+
+    self.entries[key] = (values, shm)
+    self.nbytes += values.nbytes
+    self._evict()
+    return values
+
+  def handles(self, keys: Iterable[ZipfKey] | None = None) -> list[SharedZipfHandle]:
+    """
+    Handles for shared entries (all of them by default), to pass to attach_zipf_cache in workers
+    """
+    keys = list(self.entries) if keys is None else [(kind, n, float(theta)) for kind, n, theta in keys]
+    return [SharedZipfHandle(key=key, shm_name=self.entries[key][1].name, length=len(self.entries[key][0]))
+            for key in keys if self.entries[key][1] is not None]
+
+  def attach(self, handles: Iterable[SharedZipfHandle]):
+    for handle in handles:
+      if handle.key in self.attached:
+        continue
+      shm = attach_untracked(handle.shm_name)
+      array = np.frombuffer(shm.buf, dtype=np.float64, count=handle.length)
+      array.flags.writeable = False
+      self.attached[handle.key] = (array, shm)
+
+  def _evict(self):
+    while self.nbytes > self.max_bytes and len(self.entries) > 1:
+      _, (values, shm) = self.entries.popitem(last=False)
+      self.nbytes -= values.nbytes
+      del values
+      if shm is not None:
+        self._release(shm)
+    self._close_retired()
+
+  def _release(self, shm: SharedMemory):
+    if os.getpid() != self.owner_pid:
+      return
+    shm.unlink()
+    try:
+      shm.close()
+    except BufferError:
+      self.retired.append(shm)
+
+  def _close_retired(self):
+    still_open = []
+    for shm in self.retired:
+      try:
+        shm.close()
+      except BufferError:
+        still_open.append(shm)
+    self.retired = still_open
+
+  def close(self):
+    """
+    Drop every entry, unlinking the segments this process owns
+    """
+    for _, shm in self.attached.values():
+      try:
+        shm.close()
+      except BufferError:
+        pass
+    self.attached.clear()
+    while self.entries:
+      _, (_, shm) = self.entries.popitem()
+      if shm is not None:
+        self._release(shm)
+    self.nbytes = 0
+    self._close_retired()
+
+ZIPF_CACHE = SharedZipfCache()
+atexit.register(ZIPF_CACHE.close)
+
+def attach_zipf_cache(handles: Iterable[SharedZipfHandle]):
+  """
+  Pool initializer: make the parent's shared Zipf arrays visible to make_zipf_weights/make_zipf_sampler
+  """
+  ZIPF_CACHE.attach(handles)
+
+def make_zipf_weights(n: int, alpha: float) -> np.array:
+  """
+  Unnormalized weights 1/(rank+1)**alpha; the returned array is shared and read-only
+  """
+  return ZIPF_CACHE.get("weights", n, alpha)
+
+HARMONIC_EXACT_TERMS = 1024
+
+def generalized_harmonic(n: int, theta: float, num_exact: int = HARMONIC_EXACT_TERMS) -> Tuple[float, float]:
+  """
+  H(n, theta) = sum_{i=1}^n i**-theta without materializing the terms, and a bound on the approximation error.
+  The first num_exact terms are summed directly; the rest use Euler-Maclaurin through the B4 term.
+  """
+  if n <= num_exact:
+    return float((1.0 / np.arange(1, n + 1)**theta).sum()), 0.0
+
+  a, b = num_exact, n
+  head = float((1.0 / np.arange(1, a)**theta).sum())  # terms 1..a-1; the tail formula includes a
 
-def make_workload(addr_space: np.array, num_txn: int, num_elems_per_txn: int, zipf_param: float, write_probability: float) -> List[Transaction]:
+  # Integral of x**-theta over [a, b]; the expm1 form stays accurate as theta approaches 1
+  s = 1.0 - theta
+  log_ratio = math.log(b / a)
+  integral = log_ratio if s == 0 else a**s * math.expm1(s * log_ratio) / s
+
+  f = lambda x: x**-theta
+  df = lambda x: -theta * x**(-theta - 1)
+  d3f = lambda x: -theta * (theta + 1) * (theta + 2) * x**(-theta - 3)
+  tail = integral + (f(a) + f(b)) / 2 + (df(b) - df(a)) / 12 - (d3f(b) - d3f(a)) / 720
+
+  # The fourth derivative keeps one sign, so the remainder is at most |B4|/4! * |d3f(b) - d3f(a)|
+  error = abs(d3f(b) - d3f(a)) / 720
+  return head + tail, error
+
+def zipf_cdf(rank: int, n: int, theta: float) -> float:
+  """
+  Probability that a Zipf draw over ranks 0..n-1 (as sampled by ZipfSampler) is at most rank
+  """
+  if rank < 0:
+    return 0.0
+  if rank >= n - 1:
+    return 1.0
+  return zipf_top_k_mass(rank + 1, n, theta)
+
+def zipf_top_k_mass(k: int, n: int, theta: float) -> float:
+  """
+  Fraction of Zipf probability mass held by the k most popular of n records
+  """
+  if k <= 0:
+    return 0.0
+  if k >= n:
+    return 1.0
+  if theta == 0:
+    return k / n
+  return generalized_harmonic(k, theta)[0] / generalized_harmonic(n, theta)[0]
+
+@dataclass(frozen=True, eq=False)
+class ZipfSampler:
+  """
+  Draws ranks 0..n-1 with probability proportional to 1/(rank+1)**theta by inverse-CDF lookup
+  """
+  n: int
+  theta: float
+  cdf: np.ndarray | None  # None for the uniform case
+
+  def sample(self, rng: np.random.Generator, size: int | Tuple[int, ...]) -> np.ndarray:
+    if self.cdf is None:
+      return rng.integers(0, self.n, size=size)
+    # Looking up sorted draws walks the CDF in order, which is far more cache-friendly for large n
+    draws = rng.random(size).ravel()
+    order = np.argsort(draws)
+    ranks = np.empty(len(draws), dtype=np.int64)
+    ranks[order] = np.searchsorted(self.cdf, draws[order], side='right')
+    return np.minimum(ranks, self.n - 1).reshape(size)
+
+def make_zipf_sampler(n: int, theta: float) -> ZipfSampler:
+  cdf = ZIPF_CACHE.get("cdf", n, theta) if theta != 0 else None
+  return ZipfSampler(n=n, theta=theta, cdf=cdf)
+
+_WRITE_SHIFT = 62
+_OBJ_MASK = (1 << _WRITE_SHIFT) - 1
+_INVALID_KEY = np.iinfo(np.int64).max  # sorts after every (write, obj) key
+
+@dataclass(frozen=True, eq=False)
+class Workload(Sequence[Transaction]):
+  """
+  Columnar workload: transaction i accesses objs[offsets[i]:offsets[i+1]], writing those whose write flag is set.
+  Within a transaction, accesses are sorted with reads before writes and contain no duplicates.
+  Indexing returns a Transaction view; slicing returns a Workload sharing the same arrays.
+  """
+  offsets: np.ndarray  # (num_txns + 1,) int64
+  objs: np.ndarray     # (num_accesses,) int64
+  writes: np.ndarray   # (num_accesses,) bool
+  first_id: int = 0
+
+  def __post_init__(self):
+    assert self.offsets.ndim == 1 and len(self.offsets) >= 1
+    assert len(self.objs) == len(self.writes) == self.offsets[-1] - self.offsets[0]
+
+  @staticmethod
+  def from_matrix(obj_matrix: np.ndarray, write_matrix: np.ndarray, valid: np.ndarray | None = None) -> "Workload":
+    """
+    Build from (num_txns, objs_per_txn) arrays of objects and write flags, ignoring slots where valid is False
+    """
+    objs = np.asarray(obj_matrix, dtype=np.int64)
+    writes = np.asarray(write_matrix, dtype=np.bool_)
+    assert objs.size == 0 or (objs.min() >= 0 and objs.max() < _OBJ_MASK), "Object IDs must fit in 62 bits"
+
+    # Sorting (write << 62 | obj) row by row puts reads first and makes duplicates adjacent
+    keys = (writes.astype(np.int64) << _WRITE_SHIFT) | objs
+    if valid is not None:
+      keys[~valid] = _INVALID_KEY
+    keys = np.sort(keys, axis=1)
+    keep = np.ones(keys.shape, dtype=np.bool_)
+    keep[:, 1:] = keys[:, 1:] != keys[:, :-1]
+    keep &= keys != _INVALID_KEY
+
+    offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+    np.cumsum(keep.sum(axis=1), out=offsets[1:])
+    keys = keys[keep]
+    return Workload(offsets=offsets, objs=keys & _OBJ_MASK, writes=(keys >> _WRITE_SHIFT).astype(np.bool_))
+
+  @staticmethod
+  def from_transactions(txns: Iterable[Transaction]) -> "Workload":
+    rows, objs, writes = [], [], []
+    num_txns = 0
+    for row, txn in enumerate(txns):
+      for flag, objset in [(False, txn.read_set), (True, txn.write_set)]:
+        rows.extend([row] * len(objset))
+        objs.extend(objset)
+        writes.extend([flag] * len(objset))
+      num_txns = row + 1
+    return Workload._from_accesses(num_txns, np.array(rows, dtype=np.int64),
+                                   np.array(objs, dtype=np.int64), np.array(writes, dtype=np.bool_))
+
+  @staticmethod
+  def _from_accesses(num_txns: int, rows: np.ndarray, objs: np.ndarray, writes: np.ndarray) -> "Workload":
+    order = np.lexsort((objs, writes, rows))
+    rows, objs, writes = rows[order], objs[order], writes[order]
+    keep = np.ones(len(objs), dtype=np.bool_)
+    keep[1:] = (rows[1:] != rows[:-1]) | (writes[1:] != writes[:-1]) | (objs[1:] != objs[:-1])
+    rows, objs, writes = rows[keep], objs[keep], writes[keep]
+    offsets = np.zeros(num_txns + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=num_txns), out=offsets[1:])
+    return Workload(offsets=offsets, objs=objs, writes=writes)
+
+  def __len__(self) -> int:
+    return len(self.offsets) - 1
+
+  @overload
+  def __getitem__(self, i: int) -> Transaction: ...
+  @overload
+  def __getitem__(self, i: slice) -> "Workload": ...
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      start, stop, step = i.indices(len(self))
+      assert step == 1, "Workload slices must be contiguous"
+      stop = max(start, stop)
+      offsets = self.offsets[start:stop + 1]
+      lo, hi = offsets[0] - self.offsets[0], offsets[-1] - self.offsets[0]
+      return Workload(offsets=offsets, objs=self.objs[lo:hi], writes=self.writes[lo:hi],
+                      first_id=self.first_id + start)
+    if i < 0:
+      i += len(self)
+    if not 0 <= i < len(self):
+      raise IndexError("Workload index out of range")
+    reads, writes = self.access_sets(i)
+    return Transaction(ids=frozenset({self.first_id + i}),
+                       read_set=frozenset(reads.tolist()),
+                       write_set=frozenset(writes.tolist()))
+
+  def __iter__(self) -> Iterator[Transaction]:
+    for i in range(len(self)):
+      yield self[i]
+
+  def access_sets(self, i: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Objects read and objects written by transaction i
+    """
+    lo, hi = self.offsets[i] - self.offsets[0], self.offsets[i + 1] - self.offsets[0]
+    objs, writes = self.objs[lo:hi], self.writes[lo:hi]
+    split = hi - lo - np.count_nonzero(writes)
+    return objs[:split], objs[split:]
+
+  @property
+  def sizes(self) -> np.ndarray:
+    """
+    Number of distinct accesses per transaction
+    """
+    return np.diff(self.offsets)
+
+  @property
+  def rows(self) -> np.ndarray:
+    """
+    Index (within this workload) of the transaction making each access
+    """
+    return np.repeat(np.arange(len(self)), self.sizes)
+
+def make_workload(addr_space: np.ndarray | int, num_txn: int, num_elems_per_txn: int, zipf_param: float, write_probability: float,
+                  rng: np.random.Generator | None = None) -> Workload:
+  """
+  addr_space lists the objects in popularity order; an int n stands for range(n) without materializing it
+  """
   if num_elems_per_txn == 0:
     # Special case: return empty read/write sets
-    return [Transaction(ids=frozenset({i}), read_set=frozenset(), write_set=frozenset()) for i in range(num_txn)]
+    return Workload.from_matrix(np.zeros((num_txn, 0), dtype=np.int64), np.zeros((num_txn, 0), dtype=np.bool_))
+
+  rng = rng if rng is not None else np.random.default_rng()
+  addr_space = np.asarray(addr_space)
+  sampler = make_zipf_sampler(int(addr_space) if addr_space.ndim == 0 else len(addr_space), zipf_param)
+  shape = (num_txn, num_elems_per_txn)
 
-  zipf = make_zipf_weights(len(addr_space), zipf_param)
-  total_objs = num_txn * num_elems_per_txn
+  obj_matrix = sampler.sample(rng, shape)
+  if addr_space.ndim > 0:
+    obj_matrix = addr_space[obj_matrix]
+  write_matrix = rng.random(shape) < write_probability
 
-  all_objs = random.choices(population=addr_space, weights=zipf, k=total_objs)
-  all_writes = random.choices(population=[False, True], weights=[1 - write_probability, write_probability], k=total_objs)
+  return Workload.from_matrix(obj_matrix, write_matrix)
 
-  obj_matrix = np.array(all_objs).reshape((num_txn, num_elems_per_txn))
-  write_matrix = np.array(all_writes).reshape((num_txn, num_elems_per_txn))
+GENERATE_CHUNK_SIZE = 2**16
 
-  args = [(i, obj_matrix[i], write_matrix[i]) for i in range(num_txn)]
+def chunk_seed(seed: np.random.SeedSequence, chunk_index: int) -> np.random.SeedSequence:
+  """
+  The chunk_index-th child of seed, identical to seed.spawn(n)[chunk_index] for a fresh seed but computable anywhere
+  """
+  return np.random.SeedSequence(entropy=seed.entropy, spawn_key=seed.spawn_key + (chunk_index,), pool_size=seed.pool_size)
 
-  with Pool(processes=cpu_count()) as pool:
-    txns = pool.map(_build_single_txn, args)
+def make_workload_chunk(addr_space: np.ndarray | int, num_txn: int, num_elems_per_txn: int, zipf_param: float,
+                        write_probability: float, seed: np.random.SeedSequence, chunk_index: int,
+                        chunk_size: int = GENERATE_CHUNK_SIZE) -> Workload:
+  """
+  Transactions [chunk_index * chunk_size, ...) of the workload determined by seed; chunks can be built in any order or process
+  """
+  start = chunk_index * chunk_size
+  assert 0 <= start < num_txn or num_txn == start == 0
+  rng = np.random.default_rng(chunk_seed(seed, chunk_index))
+  chunk = make_workload(addr_space, min(chunk_size, num_txn - start), num_elems_per_txn, zipf_param, write_probability, rng)
+  return replace(chunk, first_id=start)
 
-  return txns
+def make_workload_chunked(addr_space: np.ndarray | int, num_txn: int, num_elems_per_txn: int, zipf_param: float,
+                          write_probability: float, seed: int | np.random.SeedSequence | None = None,
+                          chunk_size: int = GENERATE_CHUNK_SIZE) -> Workload:
+  """
+  Reproducible in-memory counterpart of generate_workload_bin: the same seed yields the same transactions
+  """
+  seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+  chunks = [make_workload_chunk(addr_space, num_txn, num_elems_per_txn, zipf_param, write_probability, seed, c, chunk_size)
+            for c in range(math.ceil(num_txn / chunk_size))]
+  if not chunks:
+    return make_workload(addr_space, 0, num_elems_per_txn, zipf_param, write_probability)
+  offsets = np.zeros(num_txn + 1, dtype=np.int64)
+  np.cumsum(np.concatenate([c.sizes for c in chunks]), out=offsets[1:])
+  return Workload(offsets=offsets,
+                  objs=np.concatenate([c.objs for c in chunks]),
+                  writes=np.concatenate([c.writes for c in chunks]))
 
 def compress_transaction(transaction: Transaction, family: Callable[[], Set]) -> Transaction:
   """
@@ -78,13 +454,101 @@ def compress_transaction(transaction: Transaction, family: Callable[[], Set]) ->
   new_txn = Transaction(ids=transaction.ids, read_set=read_set, write_set=write_set)
   return new_txn
 
-def compress_workload(workload: list[Transaction], family: Callable[[], Set]) -> list[Transaction]:
+@dataclass(frozen=True, eq=False)
+class SignatureMatrix(Sequence[Transaction]):
+  """
+  Packed ParallelBloomFilter signatures for a whole workload: row i of reads/writes holds the words of
+  transaction i's read/write signature. Indexing yields Transactions whose sets are ParallelBloomFilter views of the rows.
+  """
+  reads: np.ndarray   # (num_txns, num_parts * words_per_part) uint64
+  writes: np.ndarray  # (num_txns, num_parts * words_per_part) uint64
+  family: ParallelBloomFilterFamily
+  first_id: int = 0
+
+  def __post_init__(self):
+    assert self.reads.shape == self.writes.shape
+    assert self.reads.shape[1] == self.family.num_parts * self.family.words_per_part
+
+  @staticmethod
+  def from_workload(workload: Workload, family: ParallelBloomFilterFamily) -> "SignatureMatrix":
+    width = family.num_parts * family.words_per_part
+    planes = np.zeros((2, len(workload), width), dtype=np.uint64)
+
+    positions = hash_family_many(family.hash_fns, workload.objs).astype(np.uint64)
+    word_idx = (positions >> np.uint64(6)).astype(np.intp) + (np.arange(family.num_parts) * family.words_per_part)[:, None]
+    masks = np.uint64(1) << (positions & np.uint64(63))
+    # Flat index into planes: (plane, row, word), with plane 1 for writes
+    flat_idx = (workload.writes.astype(np.intp) * len(workload) + workload.rows) * width + word_idx
+    np.bitwise_or.at(planes.reshape(-1), flat_idx.ravel(), masks.ravel())
+
+    return SignatureMatrix(reads=planes[0], writes=planes[1], family=family, first_id=workload.first_id)
+
+  def __len__(self) -> int:
+    return len(self.reads)
+
+  def _signature(self, words: np.ndarray) -> ParallelBloomFilter:
+    return ParallelBloomFilter(words=words, hash_fns=self.family.hash_fns, len_per_part=self.family.len_per_part)
+
+  @overload
+  def __getitem__(self, i: int) -> Transaction: ...
+  @overload
+  def __getitem__(self, i: slice) -> "SignatureMatrix": ...
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      start, _, step = i.indices(len(self))
+      assert step == 1, "SignatureMatrix slices must be contiguous"
+      return SignatureMatrix(reads=self.reads[i], writes=self.writes[i], family=self.family, first_id=self.first_id + start)
+    if i < 0:
+      i += len(self)
+    if not 0 <= i < len(self):
+      raise IndexError("SignatureMatrix index out of range")
+    return Transaction(ids=frozenset({self.first_id + i}),
+                       read_set=self._signature(self.reads[i]),
+                       write_set=self._signature(self.writes[i]))
+
+  def __iter__(self) -> Iterator[Transaction]:
+    for i in range(len(self)):
+      yield self[i]
+
+  def conflict_mask(self, reads: np.ndarray, writes: np.ndarray) -> np.ndarray:
+    """
+    For each row, whether it conflicts with a transaction whose signatures have the given words, using the same
+    rule as Transaction.compat: some partition-complete overlap in (r1 & w2) | (w1 & r2) | (w1 & w2)
+    """
+    overlap = (self.reads & writes) | (self.writes & reads) | (self.writes & writes)
+    return overlap.reshape(len(self), self.family.num_parts, self.family.words_per_part).any(axis=2).all(axis=1)
+
+def compress_workload(workload: Sequence[Transaction], family: Callable[[], Set]) -> Sequence[Transaction]:
   """
   Compress a workload from exact set representation into bloom filter representation
   """
-  return [compress_transaction(txn, family) for txn in workload]
+  if not isinstance(workload, Workload):
+    return [compress_transaction(txn, family) for txn in workload]
+  if isinstance(family, ParallelBloomFilterFamily):
+    return SignatureMatrix.from_workload(workload, family)
+
+  compressed = []
+  for i in range(len(workload)):
+    reads, writes = workload.access_sets(i)
+    read_set = family()
+    read_set.add_many(reads)
+    write_set = family()
+    write_set.add_many(writes)
+    compressed.append(Transaction(ids=frozenset({workload.first_id + i}), read_set=read_set, write_set=write_set))
+  return compressed
+
+def export_workload_to_csv(transactions: Sequence[Transaction], filename: str):
+  if isinstance(transactions, Workload):
+    # Each access becomes an (obj, is_write) pair; reads already precede writes within a txn
+    pairs = np.column_stack([transactions.objs, transactions.writes]).ravel().tolist()
+    bounds = 2 * (transactions.offsets - transactions.offsets[0])
+    with open(filename, mode='w', newline='') as f:
+      writer = csv.writer(f)
+      for txn_id in range(len(transactions)):
+        writer.writerow([txn_id, 0, *pairs[bounds[txn_id]:bounds[txn_id + 1]]])
+    return
 
-def export_workload_to_csv(transactions: List[Transaction], filename: str):
   with open(filename, mode='w', newline='') as f:
     writer = csv.writer(f)
     for txn_id, txn in enumerate(transactions):
@@ -95,9 +559,189 @@ def export_workload_to_csv(transactions: List[Transaction], filename: str):
         row.extend([obj, 1])
       writer.writerow(row)
 
+# Binary workload format read by parse_workload_bin (runner/include/workload.h)
+TXN_BIN_MAGIC = 0x54584E53
+TXN_BIN_VERSION = 1
+MAX_TXN_OBJS = 16
+TXN_BIN_HEADER = struct.Struct("<IIiII")  # magic, version, num_txns, max_objs, reserved
+TXN_BIN_DTYPE = np.dtype([
+  ("id", "<u4"),
+  ("aux_data", "<u4"),
+  ("num_reads", "<u4"),
+  ("num_writes", "<u4"),
+  ("reads", "<u4", (MAX_TXN_OBJS,)),
+  ("writes", "<u4", (MAX_TXN_OBJS,)),
+])
+
+def workload_to_records(workload: Workload, first_id: int = 0) -> np.ndarray:
+  """
+  Pack a workload into TXN_BIN records, numbering transactions from first_id
+  """
+  records = np.zeros(len(workload), dtype=TXN_BIN_DTYPE)
+  records["id"] = first_id + np.arange(len(workload))
+
+  rows = workload.rows
+  num_writes = np.bincount(rows, weights=workload.writes, minlength=len(workload)).astype(np.int64)
+  num_reads = workload.sizes - num_writes
+  if len(workload) > 0 and max(num_reads.max(), num_writes.max()) > MAX_TXN_OBJS:
+    raise Exception(f"Transaction exceeds MAX_TXN_OBJS={MAX_TXN_OBJS}")
+  if len(workload.objs) > 0 and (workload.objs.min() < 0 or workload.objs.max() >= 2**32):
+    raise Exception("Object IDs must fit in 32 bits")
+  records["num_reads"] = num_reads
+  records["num_writes"] = num_writes
+
+  # Slot of each access within its txn's read or write array (reads precede writes in the CSR layout)
+  slots = np.arange(len(rows)) - (workload.offsets[rows] - workload.offsets[0])
+  writes = workload.writes
+  slots[writes] -= num_reads[rows[writes]]
+  records["reads"][rows[~writes], slots[~writes]] = workload.objs[~writes]
+  records["writes"][rows[writes], slots[writes]] = workload.objs[writes]
+  return records
+
+class TxnBinWriter:
+  """
+  Streams TXN_BIN records to a file chunk by chunk; the header's transaction count is patched on close
+  """
+  def __init__(self, filename: str):
+    self.file = open(filename, "wb")
+    self.num_txns = 0
+    self._write_header()
+
+  def _write_header(self):
+    self.file.seek(0)
+    self.file.write(TXN_BIN_HEADER.pack(TXN_BIN_MAGIC, TXN_BIN_VERSION, self.num_txns, MAX_TXN_OBJS, 0))
+
+  def write(self, txns: Workload | Sequence[Transaction] | np.ndarray):
+    """
+    Append a chunk of transactions (or pre-packed TXN_BIN_DTYPE records), numbering them consecutively
+    """
+    if isinstance(txns, np.ndarray):
+      assert txns.dtype == TXN_BIN_DTYPE
+      records = txns
+    else:
+      if not isinstance(txns, Workload):
+        txns = Workload.from_transactions(txns)
+      records = workload_to_records(txns, first_id=self.num_txns)
+    if self.num_txns + len(records) > 2**31 - 1:
+      raise Exception("TXN_BIN files hold at most 2**31 - 1 transactions")
+    records.tofile(self.file)
+    self.num_txns += len(records)
+
+  def close(self):
+    if self.file.closed:
+      return
+    self._write_header()
+    self.file.close()
+
+  def __enter__(self) -> Self:
+    return self
+
+  def __exit__(self, *_):
+    self.close()
+
+def records_to_workload(records: np.ndarray, first_id: int = 0) -> Workload:
+  """
+  Unpack TXN_BIN records into a Workload
+  """
+  slots = np.arange(MAX_TXN_OBJS)
+  valid = np.hstack([slots < records["num_reads"][:, None], slots < records["num_writes"][:, None]])
+  objs = np.hstack([records["reads"], records["writes"]])
+  writes = np.zeros(objs.shape, dtype=np.bool_)
+  writes[:, MAX_TXN_OBJS:] = True
+  return replace(Workload.from_matrix(objs, writes, valid), first_id=first_id)
+
+class BinWorkload(Sequence[Transaction]):
+  """
+  Read-only, memory-mapped view of a TXN_BIN file.
+  Field arrays and slices are views into the file; only the pages touched are read.
+  """
+  filename: str
+  records: np.ndarray
+
+  def __init__(self, filename: str):
+    self.filename = filename
+    with open(filename, "rb") as f:
+      header = f.read(TXN_BIN_HEADER.size)
+    if len(header) < TXN_BIN_HEADER.size:
+      raise Exception(f"{filename}: truncated TXN_BIN header")
+    magic, version, num_txns, max_objs, _ = TXN_BIN_HEADER.unpack(header)
+    if magic != TXN_BIN_MAGIC:
+      raise Exception(f"{filename}: wrong magic number {magic:#x}")
+    if version != TXN_BIN_VERSION:
+      raise Exception(f"{filename}: unsupported TXN_BIN version {version}")
+    if max_objs != MAX_TXN_OBJS:
+      raise Exception(f"{filename}: max_objs={max_objs} does not match MAX_TXN_OBJS={MAX_TXN_OBJS}")
+    if os.path.getsize(filename) < TXN_BIN_HEADER.size + num_txns * TXN_BIN_DTYPE.itemsize:
+      raise Exception(f"{filename}: file is shorter than its {num_txns} transactions")
+
+    if num_txns == 0:
+      self.records = np.zeros(0, dtype=TXN_BIN_DTYPE)
+    else:
+      self.records = np.memmap(filename, dtype=TXN_BIN_DTYPE, mode="r", offset=TXN_BIN_HEADER.size, shape=(num_txns,))
+
+  def __len__(self) -> int:
+    return len(self.records)
+
+  @property
+  def ids(self) -> np.ndarray:
+    return self.records["id"]
+
+  @property
+  def aux_data(self) -> np.ndarray:
+    return self.records["aux_data"]
+
+  @property
+  def num_reads(self) -> np.ndarray:
+    return self.records["num_reads"]
+
+  @property
+  def num_writes(self) -> np.ndarray:
+    return self.records["num_writes"]
+
+  @property
+  def reads(self) -> np.ndarray:
+    """
+    (num_txns, MAX_TXN_OBJS) read slots; only the first num_reads of each row are meaningful
+    """
+    return self.records["reads"]
+
+  @property
+  def writes(self) -> np.ndarray:
+    """
+    (num_txns, MAX_TXN_OBJS) write slots; only the first num_writes of each row are meaningful
+    """
+    return self.records["writes"]
+
+  @overload
+  def __getitem__(self, i: int) -> Transaction: ...
+  @overload
+  def __getitem__(self, i: slice) -> Workload: ...
+
+  def __getitem__(self, i):
+    if isinstance(i, slice):
+      start, stop, step = i.indices(len(self))
+      assert step == 1, "BinWorkload slices must be contiguous"
+      return records_to_workload(self.records[start:max(start, stop)], first_id=start)
+    if i < 0:
+      i += len(self)
+    return records_to_workload(self.records[i:i + 1], first_id=i)[0]
+
+  def __iter__(self) -> Iterator[Transaction]:
+    for chunk in self.iter_chunks():
+      yield from chunk
+
+  def iter_chunks(self, chunk_size: int = 2**16) -> Iterator[Workload]:
+    for start in range(0, len(self), chunk_size):
+      yield self[start:start + chunk_size]
+
+def export_workload_to_bin(transactions: Workload | Sequence[Transaction], filename: str, chunk_size: int = 2**16):
+  with TxnBinWriter(filename) as writer:
+    for start in range(0, len(transactions), chunk_size):
+      writer.write(transactions[start:start + chunk_size])
+
 def generate_filename(num_objs_per_txn: int, write_prob: float, zipf_param: float,
-                      addr_space: int, num_txns: int) -> str:
-  return f"size_{num_objs_per_txn}_write_{int(write_prob * 100):02d}_zipf_{int(zipf_param * 100):02d}_addr_{addr_space}_txns_{num_txns}.csv"
+                      addr_space: int, num_txns: int, ext: str = "csv") -> str:
+  return f"size_{num_objs_per_txn}_write_{int(write_prob * 100):02d}_zipf_{int(zipf_param * 100):02d}_addr_{addr_space}_txns_{num_txns}.{ext}"
 
 OBJS_PER_TXN = [8, 16]
 WRITE_PROBS = [0.05, 0.5]
@@ -105,19 +749,60 @@ ZIPF_PARAMS = [0, 0.6, 0.8]
 ADDR_SPACE_SIZE = 20_000_000
 NUM_TXNS = 1_000_000
 
-def generate_all_workloads(output_dir: str = "workloads"):
+def _write_workload_chunk(filename: str, addr_space_size: int, num_txn: int, num_elems_per_txn: int, zipf_param: float,
+                          write_probability: float, seed: np.random.SeedSequence, chunk_index: int, chunk_size: int):
+  chunk = make_workload_chunk(addr_space_size, num_txn, num_elems_per_txn, zipf_param, write_probability,
+                              seed, chunk_index, chunk_size)
+  records = workload_to_records(chunk, first_id=chunk.first_id)
+  with open(filename, "r+b") as f:
+    f.seek(TXN_BIN_HEADER.size + chunk.first_id * TXN_BIN_DTYPE.itemsize)
+    records.tofile(f)
+
+def generate_workload_bin(filename: str, addr_space_size: int, num_txn: int, num_elems_per_txn: int, zipf_param: float,
+                          write_probability: float, seed: int | np.random.SeedSequence | None = None,
+                          num_workers: int | None = None, chunk_size: int = GENERATE_CHUNK_SIZE):
+  """
+  Generate a TXN_BIN workload in fixed-size chunks, each seeded by its own SeedSequence child and written at its
+  own file offset. The file is byte-identical for any num_workers (1 runs in-process).
+  """
+  seed = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+  if num_txn > 2**31 - 1:
+    raise Exception("TXN_BIN files hold at most 2**31 - 1 transactions")
+
+  with open(filename, "wb") as f:
+    f.write(TXN_BIN_HEADER.pack(TXN_BIN_MAGIC, TXN_BIN_VERSION, num_txn, MAX_TXN_OBJS, 0))
+    f.truncate(TXN_BIN_HEADER.size + num_txn * TXN_BIN_DTYPE.itemsize)
+
+  num_chunks = math.ceil(num_txn / chunk_size)
+  args = (filename, addr_space_size, num_txn, num_elems_per_txn, zipf_param, write_probability, seed)
+  if num_workers == 1 or num_chunks <= 1:
+    for c in range(num_chunks):
+      _write_workload_chunk(*args, c, chunk_size)
+    return
+
+  if num_elems_per_txn > 0:
+    make_zipf_sampler(addr_space_size, zipf_param)  # build the CDF once; workers attach it
+  with ProcessPoolExecutor(num_workers, initializer=attach_zipf_cache, initargs=(ZIPF_CACHE.handles(),)) as pool:
+    futures = [pool.submit(_write_workload_chunk, *args, c, chunk_size) for c in range(num_chunks)]
+    for future in futures:
+      future.result()
+
+def generate_all_workloads(output_dir: str = "workloads", use_csv: bool = False, seed: int | None = None):
   os.makedirs(output_dir, exist_ok=True)
-  addr_space = np.arange(ADDR_SPACE_SIZE)
 
   cases = list(itertools.product(ZIPF_PARAMS, WRITE_PROBS, OBJS_PER_TXN))
   cases.append((0, 0, 1))  # special zero-object case
+  case_seeds = np.random.SeedSequence(seed).spawn(len(cases))
 
-  for zipf_param, write_prob, num_objs in tqdm(cases):
-    txns = make_workload(addr_space, NUM_TXNS, num_objs, zipf_param, write_prob)
-    filename = generate_filename(num_objs, write_prob, zipf_param, ADDR_SPACE_SIZE, NUM_TXNS)
+  for (zipf_param, write_prob, num_objs), case_seed in zip(tqdm(cases), case_seeds):
+    filename = generate_filename(num_objs, write_prob, zipf_param, ADDR_SPACE_SIZE, NUM_TXNS, "csv" if use_csv else "bin")
     filepath = os.path.join(output_dir, filename)
 
-    export_workload_to_csv(txns, filepath)
+    if use_csv:
+      txns = make_workload_chunked(ADDR_SPACE_SIZE, NUM_TXNS, num_objs, zipf_param, write_prob, case_seed)
+      export_workload_to_csv(txns, filepath)
+    else:
+      generate_workload_bin(filepath, ADDR_SPACE_SIZE, NUM_TXNS, num_objs, zipf_param, write_prob, case_seed)
 
 if __name__ == "__main__":
   generate_all_workloads()